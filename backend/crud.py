@@ -0,0 +1,76 @@
+"""
+Shared query helpers used across route modules
+"""
+import threading
+from typing import Callable, Hashable, Optional, TypeVar
+from cachetools import TTLCache
+from fastapi import Response
+from sqlalchemy import case, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from database import Book
+
+T = TypeVar("T")
+
+def book_exists(db: Session, book_id: int) -> bool:
+    """Check whether a book exists without loading the row"""
+    return db.query(Book.id).filter(Book.id == book_id).scalar() is not None
+
+def generate_barcodes(isbn: Optional[str], book_id: int, first: int, count: int) -> list[str]:
+    """Barcodes for copies numbered first..first+count-1 of a book"""
+    prefix = isbn.replace('-', '') if isbn else f"BOOK{book_id:04d}"
+    return [f"{prefix}{copy_num:03d}" for copy_num in range(first, first + count)]
+
+def append_note(column, note: str):
+    """SQL expression adding a line to a notes column, so it updates without a read"""
+    return case((or_(column.is_(None), column == ""), note), else_=column + "\n" + note)
+
+class CachedResult:
+    """One computed result shared by every request in this worker.
+    
+    The result is recomputed at most once per ``ttl`` seconds, and sooner
+    when asked for under a different ``key`` than it was stored with. With
+    ``stale_ttl`` the last result is also kept that long, so it can still be
+    served while the database is unreachable.
+    """
+    
+    def __init__(self, ttl: int, stale_ttl: Optional[int] = None):
+        self._fresh = TTLCache(maxsize=1, ttl=ttl)
+        self._stale = TTLCache(maxsize=1, ttl=stale_ttl) if stale_ttl else None
+        self._lock = threading.Lock()
+    
+    def get(self, compute: Callable[[], T], key: Hashable = "value") -> T:
+        """The cached result, calling compute() to refresh it on a miss"""
+        with self._lock:
+            value = self._fresh.get(key)
+        
+        if value is None:
+            value = compute()
+            with self._lock:
+                self._fresh[key] = value
+                if self._stale is not None:
+                    self._stale["value"] = value
+        
+        return value
+    
+    def get_or_stale(self, compute: Callable[[], T]) -> tuple[T, bool]:
+        """Like get(), but falls back to the last result if compute() hits a database error"""
+        try:
+            return self.get(compute), False
+        except OperationalError:
+            with self._lock:
+                value = self._stale.get("value") if self._stale is not None else None
+            if value is None:
+                raise
+            return value, True
+    
+    def clear(self):
+        """Drop the current result so the next request recomputes it"""
+        with self._lock:
+            self._fresh.clear()
+
+def cached_json_response(cache: CachedResult, compute: Callable[[], bytes]) -> Response:
+    """Serve encoded JSON from a cache, flagging a stale fallback in X-Cache-Status"""
+    content, stale = cache.get_or_stale(compute)
+    headers = {"X-Cache-Status": "stale"} if stale else None
+    return Response(content=content, media_type="application/json", headers=headers)
@@ -1,8 +1,13 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, Enum, ForeignKey, Text
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, event, func, inspect, text, Column, Integer, String, Boolean, DateTime, Float, Enum, ForeignKey, Text, Index
+from sqlalchemy.dialects import postgresql  # registers to_tsvector() for the catalog search index
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.expression import FunctionElement
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime, timedelta
 import enum
 
 # Database URL - supports both SQLite (local) and PostgreSQL (production)
@@ -16,15 +21,78 @@ print(f"🔗 Connecting to database: {DATABASE_URL}")
 # Handle SQLite vs PostgreSQL connection args
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside a writer, and NORMAL sync skips the
+        # fsync on every commit (still safe against application crashes)
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+    
     print("📁 Using SQLite database")
+    # No connection budget to share out, so the threadpool keeps AnyIO's default
+    POOL_CAPACITY = None
 else:
-    # For PostgreSQL/other databases
-    engine = create_engine(DATABASE_URL)
+    # For PostgreSQL/other databases. Every worker process has its own pool,
+    # so the deployment-wide budget DB_MAX_CONNECTIONS is split evenly across
+    # the WEB_CONCURRENCY workers (gunicorn_conf.py exports the count):
+    #   DB_POOL_SIZE + DB_MAX_OVERFLOW = DB_MAX_CONNECTIONS // WEB_CONCURRENCY
+    # The default budget of 80 stays under PostgreSQL's default
+    # max_connections of 100, leaving room for migrations and psql sessions.
+    # Connections the server has closed are dropped before being handed out,
+    # and a checkout that can't get one within DB_POOL_TIMEOUT seconds fails
+    # rather than hangs
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    max_connections = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+    pool_size = int(os.getenv("DB_POOL_SIZE", max(1, max_connections // workers)))
+    max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "0"))
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        pool_pre_ping=True,
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")),
+        pool_use_lifo=True
+    )
+    # Most connections one process can hold at once
+    POOL_CAPACITY = pool_size + max_overflow
     print("🐘 Using PostgreSQL database")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Server-side UTC timestamp used for column defaults, so inserts don't have
+# to carry a Python-generated value; the columns are naive UTC like utcnow()
+class utcnow(FunctionElement):
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+@compiles(utcnow, "postgresql")
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+# Fractional days from one timestamp column to another, e.g. hold wait times
+class days_between(FunctionElement):
+    type = Float()
+    inherit_cache = True
+
+@compiles(days_between)
+def _default_days_between(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f"(julianday({end}) - julianday({start}))"
+
+@compiles(days_between, "postgresql")
+def _pg_days_between(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f"(EXTRACT(EPOCH FROM {end} - {start}) / 86400.0)"
+
 # Enums
 class UserRoleEnum(str, enum.Enum):
     ADMIN = "admin"
@@ -48,6 +116,11 @@ class BookCopyStatusEnum(str, enum.Enum):
     DAMAGED = "damaged"
     LOST = "lost"
 
+class FineStatusEnum(str, enum.Enum):
+    UNPAID = "unpaid"
+    PAID = "paid"
+    WAIVED = "waived"
+
 class NotificationTypeEnum(str, enum.Enum):
     GENERAL = "general"
     BOOK_AVAILABLE = "book_available"
@@ -67,8 +140,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     phone = Column(String)
     address = Column(Text)
-    membership_date = Column(DateTime, default=datetime.utcnow)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    membership_date = Column(DateTime, server_default=utcnow())
+    created_at = Column(DateTime, server_default=utcnow())
     
     # Relationships
     loans = relationship("Loan", back_populates="user")
@@ -89,12 +162,35 @@ class Book(Base):
     description = Column(Text)
     total_copies = Column(Integer, default=1)
     available_copies = Column(Integer, default=1)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
     
     # Relationships
     copies = relationship("BookCopy", back_populates="book")
     holds = relationship("Hold", back_populates="book")
 
+# Full-text search document for the catalog; the GIN index below is built on
+# this exact expression, so queries must use it unchanged (PostgreSQL only)
+book_search_vector = func.to_tsvector(
+    text("'english'"),
+    func.coalesce(Book.title, text("''")) + text("' '")
+    + func.coalesce(Book.author, text("''")) + text("' '")
+    + func.coalesce(Book.isbn, text("''"))
+)
+Index("ix_books_search_tsv", book_search_vector, postgresql_using="gin").ddl_if(dialect="postgresql")
+
+# Keyset pagination of the catalog, ordered by title
+Index("ix_books_title_id", Book.title, Book.id)
+
+# Case-insensitive prefix lookups (LIKE 'abc%') for search suggestions
+Index(
+    "ix_books_title_lower", func.lower(Book.title).label("title_lower"),
+    postgresql_ops={"title_lower": "text_pattern_ops"}
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_books_author_lower", func.lower(Book.author).label("author_lower"),
+    postgresql_ops={"author_lower": "text_pattern_ops"}
+).ddl_if(dialect="postgresql")
+
 class BookCopy(Base):
     __tablename__ = "book_copies"
     
@@ -103,7 +199,7 @@ class BookCopy(Base):
     barcode = Column(String, unique=True, index=True)
     status = Column(Enum(BookCopyStatusEnum), default=BookCopyStatusEnum.AVAILABLE)
     condition_notes = Column(Text)
-    acquired_date = Column(DateTime, default=datetime.utcnow)
+    acquired_date = Column(DateTime, server_default=utcnow())
     
     # Relationships
     book = relationship("Book", back_populates="copies")
@@ -115,7 +211,7 @@ class Loan(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     book_copy_id = Column(Integer, ForeignKey("book_copies.id"), nullable=False)
-    loan_date = Column(DateTime, default=datetime.utcnow)
+    loan_date = Column(DateTime, server_default=utcnow())
     due_date = Column(DateTime, nullable=False)
     return_date = Column(DateTime)
     renewal_count = Column(Integer, default=0)
@@ -126,6 +222,13 @@ class Loan(Base):
     user = relationship("User", back_populates="loans")
     book_copy = relationship("BookCopy", back_populates="loans")
     fines = relationship("Fine", back_populates="loan")
+    
+    __table_args__ = (
+        # Overdue scans filter on status and compare due_date
+        Index("ix_loan_status_due", "status", "due_date"),
+        # Per-member lookups: active-loan limit, loan lists and activity counts
+        Index("ix_loan_user_status", "user_id", "status"),
+    )
 
 class Hold(Base):
     __tablename__ = "holds"
@@ -133,14 +236,25 @@ class Hold(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
-    hold_date = Column(DateTime, default=datetime.utcnow)
+    hold_date = Column(DateTime, server_default=utcnow())
+    fulfilled_date = Column(DateTime)
     expiry_date = Column(DateTime)
     status = Column(Enum(HoldStatusEnum), default=HoldStatusEnum.ACTIVE)
-    position_in_queue = Column(Integer)
+    # Mapped under the name the routes and HoldResponse use; the column
+    # keeps its original name so existing databases and indexes still match
+    queue_position = Column("position_in_queue", Integer)
+    notes = Column(Text)
     
     # Relationships
     user = relationship("User", back_populates="holds")
     book = relationship("Book", back_populates="holds")
+    
+    __table_args__ = (
+        # Queue lookups filter on book and status, ordered by queue position
+        Index("ix_hold_book_status_pos", "book_id", "status", "position_in_queue"),
+        # A member's holds, optionally filtered by status
+        Index("ix_hold_user_status", "user_id", "status"),
+    )
 
 class Fine(Base):
     __tablename__ = "fines"
@@ -150,13 +264,35 @@ class Fine(Base):
     loan_id = Column(Integer, ForeignKey("loans.id"), nullable=True)
     amount = Column(Float, nullable=False)
     reason = Column(String, nullable=False)  # "overdue", "damage", "lost"
-    fine_date = Column(DateTime, default=datetime.utcnow)
-    paid_date = Column(DateTime)
-    is_paid = Column(Boolean, default=False)
+    fine_date = Column(DateTime, server_default=utcnow())
+    paid_date = Column(DateTime)  # when the fine was paid or waived
+    status = Column(Enum(FineStatusEnum), server_default=FineStatusEnum.UNPAID.name)
+    notes = Column(Text)
     
     # Relationships
     user = relationship("User", back_populates="fines")
     loan = relationship("Loan", back_populates="fines")
+    
+    # Derived from status, so they can't disagree with it. A waived fine is
+    # neither: it is no longer owed, but nothing was collected for it
+    @hybrid_property
+    def is_paid(self):
+        return self.status == FineStatusEnum.PAID
+    
+    @hybrid_property
+    def is_outstanding(self):
+        return self.status == FineStatusEnum.UNPAID
+
+# Partial indexes matching the status filters: a user's outstanding fines
+# (newest first) and their recent payments
+Index(
+    "ix_fine_user_unpaid", Fine.user_id, Fine.fine_date.desc(),
+    postgresql_where=Fine.is_outstanding, sqlite_where=Fine.is_outstanding
+)
+Index(
+    "ix_fine_user_paid_date", Fine.user_id, Fine.paid_date.desc(),
+    postgresql_where=Fine.is_paid, sqlite_where=Fine.is_paid
+)
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -167,15 +303,33 @@ class Notification(Base):
     message = Column(Text, nullable=False)
     notification_type = Column(Enum(NotificationTypeEnum), default=NotificationTypeEnum.GENERAL)
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
     read_at = Column(DateTime)
     
     # Relationships
     user = relationship("User", back_populates="notifications")
+    
+    __table_args__ = (
+        # Covers the per-user unread filter and newest-first ordering
+        Index("ix_notif_user_read_created", "user_id", "is_read", "created_at"),
+        # Keyset pagination of the notification list (newest id first)
+        Index("ix_notif_user_id", "user_id", "id"),
+    )
+
+# Migration matching the schema create_all built before migrations existed;
+# databases without a recorded revision are assumed to be at it
+_INITIAL_REVISION = "0001"
 
 # Create tables
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    """Create the schema or bring it up to date with the migrations in migrations/"""
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    with engine.begin() as conn:
+        config.attributes["connection"] = conn
+        tables = set(inspect(conn).get_table_names())
+        if tables and "alembic_version" not in tables:
+            command.stamp(config, _INITIAL_REVISION)
+        command.upgrade(config, "head")
 
 # Dependency to get database session
 def get_db():
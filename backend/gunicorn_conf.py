@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for running the API in production
+Each worker is a uvicorn event loop (uvloop + httptools when installed)
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Workers inherit this, and database.py divides DB_MAX_CONNECTIONS by it to
+# size each worker's pool; pass the worker count here rather than with -w
+os.environ["WEB_CONCURRENCY"] = str(workers)
+keepalive = 5
+
+# Access logging costs a write per request; errors and warnings still go out
+accesslog = None
+loglevel = os.getenv("LOG_LEVEL", "warning")
+
+def on_starting(server):
+    """Create the schema and seed data once, before any worker starts"""
+    # Every worker runs the same startup hook; doing the work here first
+    # leaves them nothing to race over
+    from database import create_tables, engine
+    from seed_data import create_seed_data
+    try:
+        create_tables()
+        create_seed_data()
+        # Tells the app's own startup hook in each worker to skip the above
+        os.environ["LIBRARY_SCHEMA_READY"] = "1"
+    except Exception as e:
+        # Log it like main.startup_event and start anyway: each worker then
+        # retries in its own startup hook, instead of the master exiting and
+        # the container restarting in a loop while the database is down
+        print(f"❌ Startup error: {e}")
+        print(f"Error type: {type(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        # Workers are forked from this process and must open their own connections
+        engine.dispose()
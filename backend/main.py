@@ -1,5 +1,8 @@
+import os
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import RedirectResponse
 from routes.books import router as books_router
 from routes.users import router as users_router
@@ -9,7 +12,7 @@ from routes.holds import router as holds_router
 from routes.members import router as members_router
 from routes.fines import router as fines_router
 from routes.notifications import router as notifications_router
-from database import create_tables
+from database import POOL_CAPACITY, create_tables
 from seed_data import create_seed_data
 
 app = FastAPI(title="Library Management System", version="1.0.0")
@@ -26,8 +29,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Cache-Status"],
 )
 
+# Compress larger JSON payloads (list endpoints) for clients that accept gzip;
+# below about 1 KB the saved bytes don't pay for the compression time
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Sync routes run on AnyIO's shared threadpool (40 threads by default) and
+# nearly all of them hold a database connection. Threads beyond the pool's
+# capacity would only queue for a connection until DB_POOL_TIMEOUT, so on
+# PostgreSQL the threadpool defaults to the same size as the pool
+THREADPOOL_TOKENS = int(os.getenv("THREADPOOL_TOKENS", POOL_CAPACITY or 40))
+
+@app.on_event("startup")
+async def configure_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
@@ -43,6 +61,11 @@ def startup_event():
     print(f"Full DATABASE_URL: {database_url}")
     print(f"JWT_SECRET_KEY configured: {bool(os.getenv('JWT_SECRET_KEY'))}")
     
+    # Under gunicorn the master has already done this once before forking
+    if os.getenv("LIBRARY_SCHEMA_READY"):
+        print("✅ Startup complete!")
+        return
+    
     try:
         create_tables()
         print("📊 Tables created...")
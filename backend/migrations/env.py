@@ -0,0 +1,33 @@
+"""
+Alembic environment: migrations run on the app's own engine, or on the
+connection create_tables hands over so they share its transaction
+"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from database import Base, engine
+
+config = context.config
+if config.config_file_name is not None and "connection" not in config.attributes:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+def run_migrations(connection):
+    # SQLite can't alter columns in place, so batch operations rebuild the table
+    context.configure(
+        connection=connection,
+        target_metadata=Base.metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    raise SystemExit("Offline (--sql) migrations aren't supported; run them against a database")
+
+connection = config.attributes.get("connection")
+if connection is not None:
+    run_migrations(connection)
+else:
+    with engine.begin() as connection:
+        run_migrations(connection)
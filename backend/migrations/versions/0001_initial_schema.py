@@ -0,0 +1,133 @@
+"""Initial schema, as create_all built it before migrations existed
+
+Databases created by those releases are stamped with this revision by
+database.create_tables and upgraded from here.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Enums store their member names
+user_role = sa.Enum("ADMIN", "LIBRARIAN", "MEMBER", name="userroleenum")
+loan_status = sa.Enum("ACTIVE", "RETURNED", "OVERDUE", name="loanstatusenum")
+hold_status = sa.Enum("ACTIVE", "FULFILLED", "CANCELLED", name="holdstatusenum")
+copy_status = sa.Enum("AVAILABLE", "CHECKED_OUT", "ON_HOLD", "DAMAGED", "LOST", name="bookcopystatusenum")
+notification_type = sa.Enum(
+    "GENERAL", "BOOK_AVAILABLE", "OVERDUE_REMINDER", "HOLD_EXPIRING", "FINE_NOTICE",
+    name="notificationtypeenum"
+)
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("email", sa.String, nullable=False),
+        sa.Column("full_name", sa.String, nullable=False),
+        sa.Column("hashed_password", sa.String, nullable=False),
+        sa.Column("role", user_role),
+        sa.Column("is_active", sa.Boolean),
+        sa.Column("phone", sa.String),
+        sa.Column("address", sa.Text),
+        sa.Column("membership_date", sa.DateTime),
+        sa.Column("created_at", sa.DateTime),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    
+    op.create_table(
+        "books",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("title", sa.String, nullable=False),
+        sa.Column("author", sa.String, nullable=False),
+        sa.Column("isbn", sa.String),
+        sa.Column("publisher", sa.String),
+        sa.Column("publication_year", sa.Integer),
+        sa.Column("genre", sa.String),
+        sa.Column("description", sa.Text),
+        sa.Column("total_copies", sa.Integer),
+        sa.Column("available_copies", sa.Integer),
+        sa.Column("created_at", sa.DateTime),
+    )
+    op.create_index("ix_books_id", "books", ["id"])
+    op.create_index("ix_books_title", "books", ["title"])
+    op.create_index("ix_books_author", "books", ["author"])
+    op.create_index("ix_books_isbn", "books", ["isbn"], unique=True)
+    
+    op.create_table(
+        "book_copies",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("book_id", sa.Integer, sa.ForeignKey("books.id"), nullable=False),
+        sa.Column("barcode", sa.String),
+        sa.Column("status", copy_status),
+        sa.Column("condition_notes", sa.Text),
+        sa.Column("acquired_date", sa.DateTime),
+    )
+    op.create_index("ix_book_copies_id", "book_copies", ["id"])
+    op.create_index("ix_book_copies_barcode", "book_copies", ["barcode"], unique=True)
+    
+    op.create_table(
+        "loans",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("book_copy_id", sa.Integer, sa.ForeignKey("book_copies.id"), nullable=False),
+        sa.Column("loan_date", sa.DateTime),
+        sa.Column("due_date", sa.DateTime, nullable=False),
+        sa.Column("return_date", sa.DateTime),
+        sa.Column("renewal_count", sa.Integer),
+        sa.Column("status", loan_status),
+        sa.Column("notes", sa.Text),
+    )
+    op.create_index("ix_loans_id", "loans", ["id"])
+    
+    op.create_table(
+        "holds",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("book_id", sa.Integer, sa.ForeignKey("books.id"), nullable=False),
+        sa.Column("hold_date", sa.DateTime),
+        sa.Column("expiry_date", sa.DateTime),
+        sa.Column("status", hold_status),
+        sa.Column("position_in_queue", sa.Integer),
+    )
+    op.create_index("ix_holds_id", "holds", ["id"])
+    
+    op.create_table(
+        "fines",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("loan_id", sa.Integer, sa.ForeignKey("loans.id"), nullable=True),
+        sa.Column("amount", sa.Float, nullable=False),
+        sa.Column("reason", sa.String, nullable=False),
+        sa.Column("fine_date", sa.DateTime),
+        sa.Column("paid_date", sa.DateTime),
+        sa.Column("is_paid", sa.Boolean),
+    )
+    op.create_index("ix_fines_id", "fines", ["id"])
+    
+    op.create_table(
+        "notifications",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("message", sa.Text, nullable=False),
+        sa.Column("notification_type", notification_type),
+        sa.Column("is_read", sa.Boolean),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("read_at", sa.DateTime),
+    )
+    op.create_index("ix_notifications_id", "notifications", ["id"])
+
+def downgrade():
+    for table in ("notifications", "fines", "holds", "loans", "book_copies", "books", "users"):
+        op.drop_table(table)
+    bind = op.get_bind()
+    for enum_type in (notification_type, copy_status, hold_status, loan_status, user_role):
+        enum_type.drop(bind, checkfirst=True)
@@ -0,0 +1,124 @@
+"""Catch up with the models: new hold and fine columns, query indexes and
+database-generated timestamps
+
+Development builds added some of these columns and indexes on the fly
+before migrations existed, so anything already present is replaced or
+skipped rather than created twice.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+fine_status = sa.Enum("UNPAID", "PAID", "WAIVED", name="finestatusenum")
+
+# Timestamp columns the database now fills in on insert
+TIMESTAMP_COLUMNS = {
+    "users": ("membership_date", "created_at"),
+    "books": ("created_at",),
+    "book_copies": ("acquired_date",),
+    "loans": ("loan_date",),
+    "holds": ("hold_date",),
+    "fines": ("fine_date",),
+    "notifications": ("created_at",),
+}
+
+def new_columns(table):
+    """Columns added to each table since the initial schema"""
+    return {
+        "holds": [sa.Column("fulfilled_date", sa.DateTime), sa.Column("notes", sa.Text)],
+        "fines": [sa.Column("status", fine_status), sa.Column("notes", sa.Text)],
+    }.get(table, [])
+
+def new_indexes(dialect):
+    """(name, table, columns, options) of each index added since the initial schema"""
+    is_paid = sa.column("is_paid")
+    indexes = [
+        ("ix_books_title_id", "books", ["title", "id"], {}),
+        ("ix_loan_status_due", "loans", ["status", "due_date"], {}),
+        ("ix_loan_user_status", "loans", ["user_id", "status"], {}),
+        ("ix_hold_book_status_pos", "holds", ["book_id", "status", "position_in_queue"], {}),
+        ("ix_hold_user_status", "holds", ["user_id", "status"], {}),
+        ("ix_fine_user_unpaid", "fines", ["user_id", sa.text("fine_date DESC")],
+         {"postgresql_where": is_paid == sa.false(), "sqlite_where": is_paid == sa.false()}),
+        ("ix_fine_user_paid_date", "fines", ["user_id", sa.text("paid_date DESC")],
+         {"postgresql_where": is_paid == sa.true(), "sqlite_where": is_paid == sa.true()}),
+        ("ix_notif_user_read_created", "notifications", ["user_id", "is_read", "created_at"], {}),
+        ("ix_notif_user_id", "notifications", ["user_id", "id"], {}),
+    ]
+    if dialect == "postgresql":
+        indexes += [
+            # Must stay the exact expression database.book_search_vector builds
+            ("ix_books_search_tsv", "books", [sa.text(
+                "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(author, '')"
+                " || ' ' || coalesce(isbn, ''))"
+            )], {"postgresql_using": "gin"}),
+            ("ix_books_title_lower", "books", [sa.text("lower(title) text_pattern_ops")], {}),
+            ("ix_books_author_lower", "books", [sa.text("lower(author) text_pattern_ops")], {}),
+        ]
+    return indexes
+
+def utcnow(dialect):
+    """Naive UTC timestamp default, matching database.utcnow()"""
+    if dialect == "postgresql":
+        return sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)")
+    return sa.text("CURRENT_TIMESTAMP")
+
+def upgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    inspector = sa.inspect(bind)
+    indexes = new_indexes(dialect)
+    
+    # Drop indexes a development build may have made, so the SQLite table
+    # rebuilds below don't have to carry them and they're all recreated alike
+    for name, table, _, _ in indexes:
+        if name in {index["name"] for index in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
+    
+    fine_status.create(bind, checkfirst=True)  # PostgreSQL enum type
+    
+    # SQLite can't change a column default in place, so there each of these
+    # batches rebuilds its table and copies the rows across
+    for table, timestamps in TIMESTAMP_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        with op.batch_alter_table(table) as batch:
+            for column in new_columns(table):
+                if column.name not in existing:
+                    batch.add_column(column)
+            for name in timestamps:
+                batch.alter_column(name, existing_type=sa.DateTime, server_default=utcnow(dialect))
+    
+    # Existing fines take their status from is_paid
+    op.execute(
+        "UPDATE fines SET status = CASE WHEN is_paid THEN 'PAID' ELSE 'UNPAID' END WHERE status IS NULL"
+        if dialect != "postgresql" else
+        "UPDATE fines SET status = (CASE WHEN is_paid THEN 'PAID' ELSE 'UNPAID' END)::finestatusenum"
+        " WHERE status IS NULL"
+    )
+    
+    for name, table, columns, options in indexes:
+        op.create_index(name, table, columns, **options)
+
+def downgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    
+    for name, table, _, _ in new_indexes(dialect):
+        op.drop_index(name, table_name=table)
+    
+    for table, timestamps in TIMESTAMP_COLUMNS.items():
+        with op.batch_alter_table(table) as batch:
+            for column in new_columns(table):
+                batch.drop_column(column.name)
+            for name in timestamps:
+                batch.alter_column(name, existing_type=sa.DateTime, server_default=None)
+    
+    fine_status.drop(bind, checkfirst=True)
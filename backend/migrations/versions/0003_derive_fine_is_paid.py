@@ -0,0 +1,59 @@
+"""Derive Fine.is_paid from status instead of storing it
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+fine_status = sa.Enum("UNPAID", "PAID", "WAIVED", name="finestatusenum")
+
+def partial_indexes(outstanding, paid):
+    """(name, columns, where) of the two partial fine indexes"""
+    return [
+        ("ix_fine_user_unpaid", ["user_id", sa.text("fine_date DESC")], outstanding),
+        ("ix_fine_user_paid_date", ["user_id", sa.text("paid_date DESC")], paid),
+    ]
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    
+    for name, _, _ in partial_indexes(None, None):
+        op.drop_index(name, table_name="fines")
+    
+    # Rows written without a status since 0002 still only have is_paid
+    op.execute(
+        "UPDATE fines SET status = CASE WHEN is_paid THEN 'PAID' ELSE 'UNPAID' END WHERE status IS NULL"
+        if dialect != "postgresql" else
+        "UPDATE fines SET status = (CASE WHEN is_paid THEN 'PAID' ELSE 'UNPAID' END)::finestatusenum"
+        " WHERE status IS NULL"
+    )
+    
+    # New fines start unpaid however they are inserted, as is_paid did
+    with op.batch_alter_table("fines") as batch:
+        batch.drop_column("is_paid")
+        batch.alter_column("status", existing_type=fine_status, server_default="UNPAID")
+    
+    status = sa.column("status")
+    for name, columns, where in partial_indexes(status == "UNPAID", status == "PAID"):
+        op.create_index(name, "fines", columns, postgresql_where=where, sqlite_where=where)
+
+def downgrade():
+    for name, _, _ in partial_indexes(None, None):
+        op.drop_index(name, table_name="fines")
+    
+    # Waived fines were stored as paid before is_paid was derived
+    with op.batch_alter_table("fines") as batch:
+        batch.alter_column("status", existing_type=fine_status, server_default=None)
+        batch.add_column(sa.Column("is_paid", sa.Boolean))
+    op.execute("UPDATE fines SET is_paid = (status <> 'UNPAID')")
+    
+    is_paid = sa.column("is_paid")
+    for name, columns, where in partial_indexes(is_paid == sa.false(), is_paid == sa.true()):
+        op.create_index(name, "fines", columns, postgresql_where=where, sqlite_where=where)
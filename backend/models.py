@@ -1,6 +1,8 @@
 from enum import Enum
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from functools import lru_cache
+from types import UnionType
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Literal, Optional, List, Union, get_args, get_origin
 from datetime import datetime
 
 # Enums matching database
@@ -26,6 +28,25 @@ class BookCopyStatus(str, Enum):
     DAMAGED = "damaged"
     LOST = "lost"
 
+# Status values as Literals for response models - validated with a plain
+# string check rather than Enum coercion
+LoanStatusValue = Literal["active", "returned", "overdue"]
+HoldStatusValue = Literal["active", "fulfilled", "cancelled"]
+BookCopyStatusValue = Literal["available", "checked_out", "on_hold", "damaged", "lost"]
+FineStatusValue = Literal["unpaid", "paid", "waived"]
+
+# Shared config for response models: they are built once per request and
+# never mutated, so nested models are not revalidated and instances are frozen
+RESPONSE_CONFIG = ConfigDict(
+    from_attributes=True,
+    defer_build=True,
+    extra='ignore',
+    arbitrary_types_allowed=False,
+    validate_assignment=False,
+    revalidate_instances='never',
+    frozen=True,
+)
+
 # User Models
 class UserBase(BaseModel):
     email: EmailStr
@@ -51,8 +72,7 @@ class UserResponse(UserBase):
     membership_date: datetime
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_CONFIG
 
 # Book Models
 class BookBase(BaseModel):
@@ -82,48 +102,27 @@ class BookResponse(BookBase):
     available_copies: int
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_CONFIG
+
+class BookListItem(BaseModel):
+    id: int
+    title: str
+    author: str
+    genre: Optional[str] = None
+    available_copies: int
+
+    model_config = RESPONSE_CONFIG
 
 # Book Copy Models
 class BookCopyResponse(BaseModel):
     id: int
     book_id: int
     barcode: Optional[str] = None
-    status: BookCopyStatus
+    status: BookCopyStatusValue
     condition_notes: Optional[str] = None
     acquired_date: datetime
 
-    class Config:
-        from_attributes = True
-
-# Loan Models
-class LoanCreate(BaseModel):
-    book_copy_id: int
-
-class LoanResponse(BaseModel):
-    id: int
-    user_id: int
-    book_copy_id: int
-    loan_date: datetime
-    due_date: datetime
-    return_date: Optional[datetime] = None
-    renewal_count: int
-    status: LoanStatus
-    notes: Optional[str] = None
-    
-    # Nested objects
-    book_copy: BookCopyResponse
-    
-    class Config:
-        from_attributes = True
-
-class LoanRenew(BaseModel):
-    notes: Optional[str] = None
-
-class LoanReturn(BaseModel):
-    return_notes: Optional[str] = None
-    condition_notes: Optional[str] = None
+    model_config = RESPONSE_CONFIG
 
 # Loan Models
 class LoanBase(BaseModel):
@@ -147,15 +146,14 @@ class LoanResponse(BaseModel):
     due_date: datetime
     return_date: Optional[datetime] = None
     renewal_count: int = 0
-    status: str
+    status: LoanStatusValue
     notes: Optional[str] = None
     
     # Nested relationships
     book_copy: BookCopyResponse
-    user: Optional[UserResponse] = None  # Only included for staff views
+    user: Optional[UserResponse] = None  # Only included where the user is already loaded
     
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_CONFIG
 
 # Fine Models
 class FineBase(BaseModel):
@@ -171,11 +169,11 @@ class FineResponse(FineBase):
     user_id: int
     loan_id: Optional[int] = None
     fine_date: datetime
-    is_paid: bool = False
+    status: FineStatusValue = "unpaid"
+    is_paid: bool = False  # only for paid fines; waived ones are settled but unpaid
     paid_date: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_CONFIG
 
 class FinePayment(BaseModel):
     payment_method: str
@@ -188,6 +186,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    user_id: Optional[int] = None
+    role: Optional[str] = None
 
 class LoginRequest(BaseModel):
     email: EmailStr
@@ -210,17 +210,16 @@ class HoldResponse(BaseModel):
     book_id: int
     hold_date: datetime
     queue_position: int
-    status: str
+    status: HoldStatusValue
     fulfilled_date: Optional[datetime] = None
     expiry_date: Optional[datetime] = None
     notes: Optional[str] = None
     
     # Nested relationships
     book: BookResponse
-    user: Optional[UserResponse] = None  # Only included for staff views
+    user: Optional[UserResponse] = None  # Only included where the user is already loaded
     
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_CONFIG
 
 # Membership Statistics
 class MembershipStats(BaseModel):
@@ -235,6 +234,8 @@ class MembershipStats(BaseModel):
     current_holds: List[HoldResponse]
     is_active: bool
 
+    model_config = RESPONSE_CONFIG
+
 # Notification Models
 class NotificationResponse(BaseModel):
     id: int
@@ -246,5 +247,41 @@ class NotificationResponse(BaseModel):
     created_at: datetime
     read_at: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_CONFIG
+
+# Response construction from ORM objects
+@lru_cache(maxsize=None)
+def _response_fields(model_cls: type[BaseModel]) -> tuple:
+    """Resolve each field of a response model to (name, kind, target type)"""
+    fields = []
+    for name, field in model_cls.model_fields.items():
+        target = field.annotation
+        if get_origin(target) in (Union, UnionType):
+            args = [arg for arg in get_args(target) if arg is not type(None)]
+            if len(args) == 1:
+                target = args[0]
+        
+        kind = None
+        if isinstance(target, type) and issubclass(target, BaseModel):
+            kind = "model"
+        elif isinstance(target, type) and issubclass(target, Enum):
+            kind = "enum"
+        fields.append((name, kind, target))
+    return tuple(fields)
+
+def to_response(model_cls: type[BaseModel], orm_obj):
+    """Build a response model from an ORM object without validating it.
+    
+    Only for rows loaded from our own database, which already satisfy the
+    model's types; never use it on client-supplied data.
+    """
+    values = {}
+    for name, kind, target in _response_fields(model_cls):
+        value = getattr(orm_obj, name)
+        if value is not None:
+            if kind == "model":
+                value = to_response(target, value)
+            elif kind == "enum":
+                value = target(value)
+        values[name] = value
+    return model_cls.model_construct(**values)
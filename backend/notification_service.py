@@ -2,8 +2,9 @@
 Notification service for library system
 Handles automatic notifications for various events
 """
-from sqlalchemy.orm import Session
-from database import Notification, Hold, User, Book, HoldStatusEnum, NotificationTypeEnum
+from sqlalchemy import and_
+from sqlalchemy.orm import Session, joinedload
+from database import Notification, Hold, User, Book, BookCopy, HoldStatusEnum, NotificationTypeEnum
 from datetime import datetime, timedelta
 from typing import List
 
@@ -13,24 +14,26 @@ def notify_book_available(db: Session, book_id: int, available_copies: int = 1):
     Processes holds in queue order
     """
     # Get active holds for this book, ordered by queue position
-    active_holds = db.query(Hold).filter(
+    active_holds = db.query(Hold).options(
+        joinedload(Hold.book),
+        joinedload(Hold.user)
+    ).filter(
         Hold.book_id == book_id,
         Hold.status == HoldStatusEnum.ACTIVE
     ).order_by(Hold.queue_position).limit(available_copies).all()
     
+    notifications = []
     notifications_sent = []
     
     for hold in active_holds:
         # Create notification
-        notification = Notification(
-            user_id=hold.user_id,
-            title="Book Available for Pickup",
-            message=f"Good news! '{hold.book.title}' by {hold.book.author} is now available for pickup. "
-                   f"Please visit the library within 7 days to collect your reserved book.",
-            notification_type=NotificationTypeEnum.BOOK_AVAILABLE
-        )
-        
-        db.add(notification)
+        notifications.append({
+            "user_id": hold.user_id,
+            "title": "Book Available for Pickup",
+            "message": f"Good news! '{hold.book.title}' by {hold.book.author} is now available for pickup. "
+                       f"Please visit the library within 7 days to collect your reserved book.",
+            "notification_type": NotificationTypeEnum.BOOK_AVAILABLE
+        })
         notifications_sent.append({
             "user_id": hold.user_id,
             "user_name": hold.user.full_name,
@@ -38,6 +41,7 @@ def notify_book_available(db: Session, book_id: int, available_copies: int = 1):
             "hold_id": hold.id
         })
     
+    db.bulk_insert_mappings(Notification, notifications)
     db.commit()
     return notifications_sent
 
@@ -48,44 +52,51 @@ def notify_overdue_loans(db: Session):
     """
     from database import Loan, LoanStatusEnum
     
-    # Get overdue loans that don't have recent overdue notifications
-    overdue_loans = db.query(Loan).filter(
+    now = datetime.utcnow()
+    recent_cutoff = now - timedelta(days=3)
+    
+    # Get overdue loans whose user has no overdue notification from the last
+    # 3 days; the anti-join does that check in the same query
+    overdue_loans = db.query(Loan).outerjoin(
+        Notification,
+        and_(
+            Notification.user_id == Loan.user_id,
+            Notification.notification_type == NotificationTypeEnum.OVERDUE_REMINDER,
+            Notification.created_at >= recent_cutoff
+        )
+    ).options(
+        joinedload(Loan.user),
+        joinedload(Loan.book_copy).joinedload(BookCopy.book)
+    ).filter(
         Loan.status == LoanStatusEnum.ACTIVE,
-        Loan.due_date < datetime.utcnow()
+        Loan.due_date < now,
+        Notification.id.is_(None)
     ).all()
     
+    notifications = []
     notifications_sent = []
     
     for loan in overdue_loans:
-        # Check if we've already sent an overdue notification recently (within 3 days)
-        recent_overdue_notification = db.query(Notification).filter(
-            Notification.user_id == loan.user_id,
-            Notification.notification_type == NotificationTypeEnum.OVERDUE_REMINDER,
-            Notification.created_at >= datetime.utcnow() - timedelta(days=3)
-        ).first()
+        days_overdue = (now - loan.due_date).days
+        fine_amount = days_overdue * 0.50  # $0.50 per day
         
-        if not recent_overdue_notification:
-            days_overdue = (datetime.utcnow() - loan.due_date).days
-            fine_amount = days_overdue * 0.50  # $0.50 per day
-            
-            notification = Notification(
-                user_id=loan.user_id,
-                title="Overdue Book Reminder",
-                message=f"Your book '{loan.book_copy.book.title}' was due on {loan.due_date.strftime('%Y-%m-%d')} "
+        notifications.append({
+            "user_id": loan.user_id,
+            "title": "Overdue Book Reminder",
+            "message": f"Your book '{loan.book_copy.book.title}' was due on {loan.due_date.strftime('%Y-%m-%d')} "
                        f"and is now {days_overdue} days overdue. Current fine: ${fine_amount:.2f}. "
                        f"Please return the book as soon as possible to avoid additional charges.",
-                notification_type=NotificationTypeEnum.OVERDUE_REMINDER
-            )
-            
-            db.add(notification)
-            notifications_sent.append({
-                "user_id": loan.user_id,
-                "user_name": loan.user.full_name,
-                "book_title": loan.book_copy.book.title,
-                "days_overdue": days_overdue,
-                "fine_amount": fine_amount
-            })
+            "notification_type": NotificationTypeEnum.OVERDUE_REMINDER
+        })
+        notifications_sent.append({
+            "user_id": loan.user_id,
+            "user_name": loan.user.full_name,
+            "book_title": loan.book_copy.book.title,
+            "days_overdue": days_overdue,
+            "fine_amount": fine_amount
+        })
     
+    db.bulk_insert_mappings(Notification, notifications)
     db.commit()
     return notifications_sent
 
@@ -97,10 +108,14 @@ def notify_hold_expiring(db: Session):
     from datetime import timedelta
     
     # Get holds that will expire in 1 day
-    tomorrow = datetime.utcnow() + timedelta(days=1)
-    expiring_holds = db.query(Hold).filter(
+    now = datetime.utcnow()
+    tomorrow = now + timedelta(days=1)
+    expiring_holds = db.query(Hold).options(
+        joinedload(Hold.book),
+        joinedload(Hold.user)
+    ).filter(
         Hold.status == HoldStatusEnum.FULFILLED,
-        Hold.expiry_date.between(datetime.utcnow(), tomorrow)
+        Hold.expiry_date.between(now, tomorrow)
     ).all()
     
     notifications_sent = []
@@ -1,24 +1,28 @@
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from models import UserCreate, UserResponse, LoginRequest, Token, UserRole
-from auth import hash_password, verify_password, create_access_token, verify_token
+from auth import ahash_password, averify_and_update_password, create_access_token, verify_token
 from database import get_db, User
 from datetime import timedelta
 
 router = APIRouter()
 
-@router.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Hash password and create user
-    hashed_password = hash_password(user.password)
+# Register and login are async so the password hash, run on auth's hashing
+# pool, is awaited without holding a threadpool thread. Their database work
+# still runs on the threadpool, and each step ends its transaction so no
+# connection is held while the hash is computed
+
+def _email_registered(db: Session, email: str) -> bool:
+    """Whether an account already uses this email"""
+    try:
+        return db.query(User.id).filter(User.email == email).first() is not None
+    finally:
+        db.rollback()
+
+def _create_user(db: Session, user: UserCreate, hashed_password: str) -> UserResponse:
+    """Insert the new account and build its response while still on the thread"""
     db_user = User(
         email=user.email,
         full_name=user.full_name,
@@ -30,19 +34,52 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(db_user)
     
-    return db_user
+    return UserResponse.model_validate(db_user)
+
+def _find_login(db: Session, email: str):
+    """The columns a login needs, or None for an unknown email"""
+    try:
+        return db.query(
+            User.id, User.email, User.role, User.is_active, User.hashed_password
+        ).filter(User.email == email).first()
+    finally:
+        db.rollback()
+
+def _store_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.execute(update(User).where(User.id == user_id).values(hashed_password=hashed_password))
+    db.commit()
+
+@router.post("/register", response_model=UserResponse)
+async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+    # Check if user already exists
+    if await run_in_threadpool(_email_registered, db, user.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    
+    # Hash password and create user
+    hashed_password = await ahash_password(user.password)
+    return await run_in_threadpool(_create_user, db, user, hashed_password)
 
 @router.post("/login", response_model=Token)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     # Find user in database
-    user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    user = await run_in_threadpool(_find_login, db, login_data.email)
+    is_valid, new_hash = False, None
+    if user:
+        is_valid, new_hash = await averify_and_update_password(login_data.password, user.hashed_password)
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Transparently re-hash legacy bcrypt hashes with the current scheme
+    if new_hash:
+        await run_in_threadpool(_store_password_hash, db, user.id, new_hash)
+    
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -52,7 +89,7 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     # Create access token
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role.value},
+        data={"sub": user.email, "uid": user.id, "role": user.role.value},
         expires_delta=access_token_expires
     )
     
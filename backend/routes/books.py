@@ -1,17 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import re
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy import func, distinct, case, insert, literal, select, text, tuple_, union_all
 from typing import List, Optional
-from models import BookCreate, BookResponse, BookUpdate, BookCopyResponse, UserRole
-from auth import get_current_user, require_role
-from database import get_db, Book, BookCopy, User, BookCopyStatusEnum
+from pydantic import TypeAdapter
+from models import BookCreate, BookResponse, BookListItem, BookUpdate, BookCopyResponse, to_response
+from auth import get_current_user, require_staff, require_admin
+from crud import CachedResult, book_exists, generate_barcodes
+from database import get_db, Book, BookCopy, User, BookCopyStatusEnum, book_search_vector
 
 router = APIRouter()
 
-@router.get("/books", response_model=List[BookResponse])
+# Serializer for the copies list, built once and reused by every request
+_COPIES_TA = TypeAdapter(List[BookCopyResponse])
+
+# Words of a catalog search, and searches that look like part of an ISBN
+_SEARCH_WORD = re.compile(r"[^\W_]+")
+_ISBN_FRAGMENT = re.compile(r"[\d-]+[Xx]?")
+
+# Encoded genre list; genres only change when books are added, edited or
+# removed, which clear it (the TTL bounds staleness across workers)
+_genre_cache = CachedResult(ttl=300)
+
+def _invalidate_genres():
+    """Drop the cached genre list after a catalog change"""
+    _genre_cache.clear()
+
+def _stream_books(query):
+    """Encode catalog rows as a JSON array while they are fetched in batches"""
+    yield b"["
+    for index, row in enumerate(query.yield_per(100)):
+        if index:
+            yield b","
+        yield orjson.dumps(row._asdict())
+    yield b"]"
+
+def _book_search_filter(search: str, dialect: str):
+    """Match books whose title, author or ISBN contains the search text.
+    
+    On PostgreSQL each word is matched as a prefix against the GIN-indexed
+    search vector, so partial words ("Gats") still find books. The vector only
+    holds whole ISBNs, so a numeric fragment also substring-matches isbn.
+    """
+    words = _SEARCH_WORD.findall(search)
+    if dialect != "postgresql" or not words:
+        search_term = f"%{search}%"
+        return (
+            (Book.title.ilike(search_term)) |
+            (Book.author.ilike(search_term)) |
+            (Book.isbn.ilike(search_term))
+        )
+    
+    prefixes = " & ".join(f"{word}:*" for word in words)
+    condition = book_search_vector.op("@@")(func.to_tsquery(text("'english'"), prefixes))
+    if _ISBN_FRAGMENT.fullmatch(search.strip()):
+        condition = condition | Book.isbn.ilike(f"%{search.strip()}%")
+    return condition
+
+@router.get("/books", response_model=List[BookListItem])
 def browse_catalog(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    after_title: Optional[str] = Query(None, description="Title of the last book on the previous page"),
+    after_id: Optional[int] = Query(None, description="ID of the last book on the previous page"),
     search: Optional[str] = Query(None, description="Search by title, author, or ISBN"),
     genre: Optional[str] = Query(None, description="Filter by genre"),
     author: Optional[str] = Query(None, description="Filter by author"),
@@ -20,16 +73,12 @@ def browse_catalog(
     current_user: User = Depends(get_current_user)
 ):
     """Browse library catalog - supports search and filters"""
-    query = db.query(Book)
+    # Only the listing columns are selected; descriptions stay in the details endpoint
+    query = db.query(Book.id, Book.title, Book.author, Book.genre, Book.available_copies)
     
     # Apply search filter
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Book.title.ilike(search_term)) |
-            (Book.author.ilike(search_term)) |
-            (Book.isbn.ilike(search_term))
-        )
+        query = query.filter(_book_search_filter(search, db.get_bind().dialect.name))
     
     # Apply genre filter
     if genre:
@@ -43,9 +92,32 @@ def browse_catalog(
     if available_only:
         query = query.filter(Book.available_copies > 0)
     
-    # Apply pagination
-    books = query.offset(skip).limit(limit).all()
-    return books
+    # Apply pagination - keyset on (title, id) when a cursor is given, so deep
+    # pages are an index seek instead of skipping rows
+    if after_title is not None or after_id is not None:
+        if after_title is None or after_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="after_title and after_id must be provided together"
+            )
+        query = query.filter(tuple_(Book.title, Book.id) > (after_title, after_id))
+    
+    books = query.order_by(Book.title, Book.id).offset(skip).limit(limit)
+    return StreamingResponse(_stream_books(books), media_type="application/json")
+
+def _encode_genres(db: Session) -> bytes:
+    """Distinct genres in the catalog, encoded as the response body"""
+    genres = db.query(Book.genre).distinct().filter(Book.genre.isnot(None)).all()
+    return orjson.dumps({"genres": [genre[0] for genre in genres if genre[0]]})
+
+@router.get("/books/genres")
+def list_available_genres(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get list of all genres in the catalog"""
+    content = _genre_cache.get(lambda: _encode_genres(db))
+    return Response(content=content, media_type="application/json")
 
 @router.get("/books/{book_id}", response_model=BookResponse)
 def get_book_details(
@@ -60,7 +132,7 @@ def get_book_details(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Book not found"
         )
-    return book
+    return to_response(BookResponse, book)
 
 @router.get("/books/{book_id}/copies", response_model=List[BookCopyResponse])
 def get_book_copies(
@@ -71,8 +143,7 @@ def get_book_copies(
 ):
     """Get all copies of a specific book with their status"""
     # Verify book exists
-    book = db.query(Book).filter(Book.id == book_id).first()
-    if not book:
+    if not book_exists(db, book_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Book not found"
@@ -92,7 +163,10 @@ def get_book_copies(
             )
     
     copies = query.all()
-    return copies
+    return Response(
+        content=_COPIES_TA.dump_json([to_response(BookCopyResponse, copy) for copy in copies]),
+        media_type="application/json"
+    )
 
 @router.get("/books/{book_id}/availability")
 def check_book_availability(
@@ -101,23 +175,29 @@ def check_book_availability(
     current_user: User = Depends(get_current_user)
 ):
     """Check availability status of a book"""
-    book = db.query(Book).filter(Book.id == book_id).first()
-    if not book:
+    # Book details and per-status copy counts in one grouped query
+    rows = db.query(
+        Book.title, Book.total_copies, Book.available_copies,
+        BookCopy.status, func.count(BookCopy.id)
+    ).outerjoin(BookCopy).filter(
+        Book.id == book_id
+    ).group_by(
+        Book.id, Book.title, Book.total_copies, Book.available_copies, BookCopy.status
+    ).all()
+    
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Book not found"
         )
+    book = rows[0]
     
-    # Get copy status counts
-    copy_counts = db.query(BookCopy.status, func.count(BookCopy.id)).filter(
-        BookCopy.book_id == book_id
-    ).group_by(BookCopy.status).all()
-    
-    status_summary = {status.value: 0 for status in BookCopyStatusEnum}
-    for status, count in copy_counts:
-        status_summary[status.value] = count
+    status_summary = {copy_status.value: 0 for copy_status in BookCopyStatusEnum}
+    for _, _, _, copy_status, count in rows:
+        if copy_status is not None:
+            status_summary[copy_status.value] = count
     
-    return {
+    return Response(content=orjson.dumps({
         "book_id": book_id,
         "title": book.title,
         "total_copies": book.total_copies,
@@ -125,13 +205,13 @@ def check_book_availability(
         "copy_status": status_summary,
         "can_borrow": book.available_copies > 0,
         "can_hold": book.available_copies == 0 and book.total_copies > 0
-    }
+    }), media_type="application/json")
 
 @router.post("/books", response_model=BookResponse)
 def add_book_to_catalog(
     book: BookCreate, 
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Add a new book to the library catalog - creates book and initial copies"""
     # Check if book with same ISBN already exists
@@ -143,40 +223,43 @@ def add_book_to_catalog(
                 detail=f"Book with ISBN {book.isbn} already exists"
             )
     
-    # Create book record
+    # Create book record; RETURNING hands back the generated id and timestamp
+    # so nothing has to be re-read after the commit
     book_data = book.dict()
     total_copies = book_data.pop("total_copies", 1)
     
-    db_book = Book(
-        **book_data,
-        total_copies=total_copies,
-        available_copies=total_copies
-    )
-    db.add(db_book)
-    db.flush()  # Get the book ID
+    book_id, created_at = db.execute(
+        insert(Book).returning(Book.id, Book.created_at),
+        {**book_data, "total_copies": total_copies, "available_copies": total_copies}
+    ).one()
     
-    # Create book copies
-    for copy_num in range(1, total_copies + 1):
-        barcode = f"{db_book.isbn.replace('-', '')}{copy_num:03d}" if db_book.isbn else f"BOOK{db_book.id:04d}{copy_num:03d}"
-        
-        book_copy = BookCopy(
-            book_id=db_book.id,
-            barcode=barcode,
-            status=BookCopyStatusEnum.AVAILABLE,
-            condition_notes="New acquisition"
-        )
-        db.add(book_copy)
+    # Create book copies in a single bulk INSERT
+    db.bulk_insert_mappings(BookCopy, [
+        {
+            "book_id": book_id,
+            "barcode": barcode,
+            "status": BookCopyStatusEnum.AVAILABLE,
+            "condition_notes": "New acquisition"
+        }
+        for barcode in generate_barcodes(book_data["isbn"], book_id, 1, total_copies)
+    ])
     
     db.commit()
-    db.refresh(db_book)
-    return db_book
+    _invalidate_genres()
+    return BookResponse.model_construct(
+        **book_data,
+        id=book_id,
+        total_copies=total_copies,
+        available_copies=total_copies,
+        created_at=created_at
+    )
 
 @router.put("/books/{book_id}", response_model=BookResponse)
 def update_book_information(
     book_id: int,
     book_update: BookUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Update book information - does not affect copies"""
     db_book = db.query(Book).filter(Book.id == book_id).first()
@@ -192,6 +275,7 @@ def update_book_information(
         setattr(db_book, field, value)
     
     db.commit()
+    _invalidate_genres()
     db.refresh(db_book)
     return db_book
 
@@ -200,7 +284,7 @@ def add_book_copies(
     book_id: int,
     copies_to_add: int = Query(..., ge=1, description="Number of copies to add"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Add additional copies of an existing book"""
     db_book = db.query(Book).filter(Book.id == book_id).first()
@@ -210,18 +294,17 @@ def add_book_copies(
             detail="Book not found"
         )
     
-    # Create new copies
+    # Create new copies in a single bulk INSERT
     current_copy_count = db_book.total_copies
-    for copy_num in range(current_copy_count + 1, current_copy_count + copies_to_add + 1):
-        barcode = f"{db_book.isbn.replace('-', '')}{copy_num:03d}" if db_book.isbn else f"BOOK{db_book.id:04d}{copy_num:03d}"
-        
-        book_copy = BookCopy(
-            book_id=db_book.id,
-            barcode=barcode,
-            status=BookCopyStatusEnum.AVAILABLE,
-            condition_notes="Additional copy"
-        )
-        db.add(book_copy)
+    db.bulk_insert_mappings(BookCopy, [
+        {
+            "book_id": db_book.id,
+            "barcode": barcode,
+            "status": BookCopyStatusEnum.AVAILABLE,
+            "condition_notes": "Additional copy"
+        }
+        for barcode in generate_barcodes(db_book.isbn, db_book.id, current_copy_count + 1, copies_to_add)
+    ])
     
     # Update book totals
     db_book.total_copies += copies_to_add
@@ -240,7 +323,7 @@ def remove_book_from_catalog(
     book_id: int,
     force: bool = Query(False, description="Force delete even if copies are checked out"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN]))
+    current_user: User = Depends(require_admin)
 ):
     """Remove a book from catalog - Admin only, checks for active loans"""
     db_book = db.query(Book).filter(Book.id == book_id).first()
@@ -269,6 +352,7 @@ def remove_book_from_catalog(
     # Delete the book
     db.delete(db_book)
     db.commit()
+    _invalidate_genres()
     
     return {"message": f"Book '{db_book.title}' and all its copies have been removed from the catalog"}
 
@@ -276,34 +360,40 @@ def remove_book_from_catalog(
 @router.get("/books/stats/catalog")
 def get_catalog_statistics(
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Get library catalog statistics - Staff only"""
-    total_books = db.query(Book).count()
-    total_copies = db.query(BookCopy).count()
-    available_copies = db.query(BookCopy).filter(BookCopy.status == BookCopyStatusEnum.AVAILABLE).count()
-    checked_out_copies = db.query(BookCopy).filter(BookCopy.status == BookCopyStatusEnum.CHECKED_OUT).count()
+    # Title and copy counts as conditional aggregates over a single scan
+    total_books, total_copies, available_copies, checked_out_copies = db.query(
+        func.count(distinct(Book.id)),
+        func.count(BookCopy.id),
+        func.coalesce(func.sum(case((BookCopy.status == BookCopyStatusEnum.AVAILABLE, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((BookCopy.status == BookCopyStatusEnum.CHECKED_OUT, 1), else_=0)), 0)
+    ).select_from(Book).outerjoin(BookCopy).one()
     
     # Genre distribution
     genre_stats = db.query(Book.genre, func.count(Book.id)).group_by(Book.genre).all()
     
-    return {
+    return Response(content=orjson.dumps({
         "total_book_titles": total_books,
         "total_physical_copies": total_copies,
         "available_copies": available_copies,
         "checked_out_copies": checked_out_copies,
         "circulation_rate": round((checked_out_copies / total_copies * 100), 2) if total_copies > 0 else 0,
         "genre_distribution": [{"genre": genre or "Unknown", "count": count} for genre, count in genre_stats]
-    }
+    }), media_type="application/json")
 
-@router.get("/books/genres")
-def list_available_genres(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get list of all genres in the catalog"""
-    genres = db.query(Book.genre).distinct().filter(Book.genre.isnot(None)).all()
-    return {"genres": [genre[0] for genre in genres if genre[0]]}
+def _suggestion_rows(db: Session, lookups):
+    """Run (kind, column, condition, limit) lookups as one UNION ALL query"""
+    selects = []
+    for kind, column, condition, limit in lookups:
+        matches = select(column.label("value")).where(condition).distinct().order_by(column).limit(limit).subquery()
+        selects.append(select(literal(kind).label("kind"), matches.c.value))
+    
+    combined = union_all(*selects).subquery()
+    return db.execute(
+        select(combined.c.kind, combined.c.value).order_by(combined.c.kind, combined.c.value)
+    ).all()
 
 @router.get("/books/search/suggestions")
 def get_search_suggestions(
@@ -312,19 +402,25 @@ def get_search_suggestions(
     current_user: User = Depends(get_current_user)
 ):
     """Get search suggestions for titles and authors"""
-    search_term = f"%{query}%"
+    limit = 5
+    columns = {"titles": Book.title, "authors": Book.author}
+    suggestions = {kind: [] for kind in columns}
     
-    # Get title suggestions
-    title_suggestions = db.query(Book.title).filter(
-        Book.title.ilike(search_term)
-    ).distinct().limit(5).all()
+    # Prefix matches first (index range scans), titles and authors together
+    prefix = f"{query.lower()}%"
+    for kind, value in _suggestion_rows(db, [
+        (kind, column, func.lower(column).like(prefix), limit) for kind, column in columns.items()
+    ]):
+        suggestions[kind].append(value)
     
-    # Get author suggestions
-    author_suggestions = db.query(Book.author).filter(
-        Book.author.ilike(search_term)
-    ).distinct().limit(5).all()
+    # Fill any remaining slots with substring matches in one more round trip
+    fallback = [
+        (kind, column, column.ilike(f"%{query}%") & column.notin_(suggestions[kind]), limit - len(suggestions[kind]))
+        for kind, column in columns.items()
+        if len(suggestions[kind]) < limit
+    ]
+    if fallback:
+        for kind, value in _suggestion_rows(db, fallback):
+            suggestions[kind].append(value)
     
-    return {
-        "titles": [title[0] for title in title_suggestions],
-        "authors": [author[0] for author in author_suggestions]
-    }
+    return suggestions
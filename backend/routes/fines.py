@@ -1,17 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+import hashlib
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, raiseload
+from sqlalchemy import func, and_, or_, case, update
 from typing import List, Optional
 from datetime import datetime, timedelta
-from models import FineResponse, FinePayment, UserRole
-from auth import get_current_user, require_role
+from models import FineResponse, FinePayment
+from auth import get_current_user, require_staff
+from crud import CachedResult, append_note
 from database import (
     get_db, User, Fine, Loan,
-    UserRoleEnum
+    FineStatusEnum, UserRoleEnum, utcnow
 )
 
 router = APIRouter()
 
+# Encoded fine statistics, keyed by _fines_fingerprint() so a change to the
+# fines is picked up by the next request in every worker, whichever worker
+# (or loan return, payment or waiver) made it; nothing has to clear them
+_stats_cache = CachedResult(ttl=60)
+
+# All-time totals scan the whole fines table; keyed the same way, but they
+# don't depend on the collections window so they outlive its daily move
+_totals_cache = CachedResult(ttl=300)
+
 @router.get("/fines/", response_model=List[FineResponse])
 def get_user_fines(
     include_paid: bool = Query(False, description="Include paid fines"),
@@ -20,119 +33,53 @@ def get_user_fines(
 ):
     """Get current user's fines"""
     
-    query = db.query(Fine).filter(Fine.user_id == current_user.id)
+    # FineResponse has no nested relationships, so none should ever load here
+    query = db.query(Fine).options(raiseload('*')).filter(Fine.user_id == current_user.id)
     
     if not include_paid:
-        query = query.filter(Fine.is_paid == False)
+        query = query.filter(Fine.is_outstanding)
     
-    fines = query.order_by(Fine.fine_date.desc()).all()
+    fines = query.order_by(Fine.fine_date.desc(), Fine.id.desc()).all()
     return fines
 
-@router.get("/fines/{fine_id}", response_model=FineResponse)
-def get_fine_details(
-    fine_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get details of a specific fine"""
-    
-    fine = db.query(Fine).filter(Fine.id == fine_id).first()
-    
-    if not fine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Fine not found"
-        )
-    
-    # Users can only see their own fines, staff can see all
-    if current_user.role == UserRoleEnum.MEMBER and fine.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    
-    return fine
-
-@router.post("/fines/{fine_id}/pay")
-def pay_fine(
-    fine_id: int,
-    payment: FinePayment,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Pay a fine"""
-    
-    fine = db.query(Fine).filter(Fine.id == fine_id).first()
-    
-    if not fine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Fine not found"
-        )
-    
-    # Users can only pay their own fines, staff can process any payment
-    if current_user.role == UserRoleEnum.MEMBER and fine.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    
-    # Check if already paid
-    if fine.is_paid:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Fine already paid"
-        )
-    
-    # Process payment
-    fine.is_paid = True
-    fine.paid_date = datetime.utcnow()
-    
-    # Add payment notes if provided
-    if payment.notes:
-        fine.notes = f"{fine.notes or ''}\nPayment: {payment.notes}".strip()
-    
-    db.commit()
-    db.refresh(fine)
-    
-    return {
-        "message": "Fine paid successfully",
-        "fine_id": fine.id,
-        "amount_paid": fine.amount,
-        "payment_date": fine.paid_date,
-        "payment_method": payment.payment_method
-    }
-
 @router.get("/fines/summary")
 def get_fine_summary(
+    limit: int = Query(20, ge=0, le=100, description="Max outstanding fines to list"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user's fine summary"""
     
     # Outstanding fines
-    outstanding_fines = db.query(Fine).filter(
-        and_(Fine.user_id == current_user.id, Fine.is_paid == False)
-    ).all()
-    
-    outstanding_amount = sum(fine.amount for fine in outstanding_fines)
+    outstanding_count, outstanding_amount = db.query(
+        func.count(Fine.id), func.coalesce(func.sum(Fine.amount), 0)
+    ).filter(
+        and_(Fine.user_id == current_user.id, Fine.is_outstanding)
+    ).one()
     
     # Paid fines (last 6 months)
     six_months_ago = datetime.utcnow() - timedelta(days=180)
-    paid_fines = db.query(Fine).filter(
+    paid_count, paid_amount = db.query(
+        func.count(Fine.id), func.coalesce(func.sum(Fine.amount), 0)
+    ).filter(
         and_(
             Fine.user_id == current_user.id,
-            Fine.is_paid == True,
+            Fine.is_paid,
             Fine.paid_date >= six_months_ago
         )
-    ).all()
+    ).one()
     
-    paid_amount = sum(fine.amount for fine in paid_fines)
+    # Only load the newest outstanding rows, and only if there are any
+    outstanding_fines = []
+    if outstanding_count and limit:
+        outstanding_fines = db.query(Fine).filter(
+            and_(Fine.user_id == current_user.id, Fine.is_outstanding)
+        ).order_by(Fine.fine_date.desc(), Fine.id.desc()).limit(limit).all()
     
     return {
-        "outstanding_fines_count": len(outstanding_fines),
+        "outstanding_fines_count": outstanding_count,
         "outstanding_amount": outstanding_amount,
-        "paid_fines_last_6_months": len(paid_fines),
+        "paid_fines_last_6_months": paid_count,
         "paid_amount_last_6_months": paid_amount,
         "can_borrow": outstanding_amount == 0,
         "outstanding_fines": outstanding_fines
@@ -146,87 +93,71 @@ def get_all_fines(
     user_id: Optional[int] = Query(None, description="Filter by user ID"),
     paid_status: Optional[bool] = Query(None, description="Filter by payment status"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Get all fines - Staff only"""
     
-    query = db.query(Fine).options(joinedload(Fine.user))
+    query = db.query(Fine)
     
     # Apply filters
     if user_id:
         query = query.filter(Fine.user_id == user_id)
     
     if paid_status is not None:
-        query = query.filter(Fine.is_paid == paid_status)
+        query = query.filter(Fine.is_paid if paid_status else Fine.is_outstanding)
     
-    fines = query.order_by(Fine.fine_date.desc()).offset(skip).limit(limit).all()
+    fines = query.order_by(Fine.fine_date.desc(), Fine.id.desc()).offset(skip).limit(limit).all()
     return fines
 
-@router.post("/fines/{fine_id}/waive")
-def waive_fine(
-    fine_id: int,
-    reason: str = Query(..., description="Reason for waiving the fine"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
-):
-    """Waive a fine - Staff only"""
-    
-    fine = db.query(Fine).filter(Fine.id == fine_id).first()
-    
-    if not fine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Fine not found"
-        )
-    
-    if fine.is_paid:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Cannot waive a fine that has already been paid"
-        )
-    
-    # Waive the fine
-    fine.is_paid = True
-    fine.paid_date = datetime.utcnow()
-    fine.notes = f"{fine.notes or ''}\nWaived by {current_user.full_name}: {reason}".strip()
-    
-    db.commit()
-    db.refresh(fine)
-    
-    return {
-        "message": "Fine waived successfully",
-        "fine_id": fine.id,
-        "waived_amount": fine.amount,
-        "waived_by": current_user.full_name,
-        "reason": reason
-    }
+def _compute_fine_totals(db: Session) -> tuple:
+    """All-time fine counts and amounts"""
+    # Counts and amounts as conditional aggregates over a single scan
+    return tuple(db.query(
+        func.count(Fine.id),
+        func.count(case((Fine.is_outstanding, 1))),
+        func.count(case((Fine.is_paid, 1))),
+        func.coalesce(func.sum(Fine.amount), 0),
+        func.coalesce(func.sum(case((Fine.is_outstanding, Fine.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Fine.is_paid, Fine.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Fine.status == FineStatusEnum.WAIVED, Fine.amount), else_=0)), 0)
+    ).one())
 
-@router.get("/fines/stats")
-def get_fine_statistics(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
-):
-    """Get fine statistics - Staff only"""
-    
-    # Total fines
-    total_fines = db.query(Fine).count()
-    outstanding_fines = db.query(Fine).filter(Fine.is_paid == False).count()
-    paid_fines = db.query(Fine).filter(Fine.is_paid == True).count()
-    
-    # Fine amounts
-    total_amount = db.query(func.sum(Fine.amount)).scalar() or 0
-    outstanding_amount = db.query(func.sum(Fine.amount)).filter(
-        Fine.is_paid == False
-    ).scalar() or 0
-    collected_amount = db.query(func.sum(Fine.amount)).filter(
-        Fine.is_paid == True
-    ).scalar() or 0
-    
-    # Recent collections (last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_collections = db.query(func.sum(Fine.amount)).filter(
-        and_(Fine.is_paid == True, Fine.paid_date >= thirty_days_ago)
-    ).scalar() or 0
+def _recent_collections_since() -> datetime:
+    """Start of the 30-day collections window; it moves once a day"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=30)
+
+def _fines_fingerprint(db: Session) -> tuple:
+    """One cheap aggregate that changes whenever the fine statistics can.
+    
+    Fines are only ever added, which changes the count and highest id, or
+    paid or waived, which both stamp paid_date. The collections window start
+    covers the one figure that moves without any fine changing.
+    """
+    count, max_id, settled, last_settled = db.query(
+        func.count(Fine.id), func.max(Fine.id), func.count(Fine.paid_date), func.max(Fine.paid_date)
+    ).one()
+    return count, max_id, settled, last_settled, _recent_collections_since()
+
+def _fingerprint_etag(fingerprint: tuple) -> str:
+    """Weak ETag for the statistics computed at this fines fingerprint"""
+    return f'W/"{hashlib.blake2b(repr(fingerprint).encode(), digest_size=16).hexdigest()}"'
+
+def _fine_totals(db: Session, fingerprint: tuple) -> tuple:
+    """All-time fine counts and amounts, recomputed when the fines change"""
+    return _totals_cache.get(lambda: _compute_fine_totals(db), key=fingerprint[:-1])
+
+def _compute_fine_statistics(db: Session, fingerprint: tuple) -> dict:
+    """Aggregate fine counts, totals and top owing users"""
+    (
+        total_fines, outstanding_fines, paid_fines,
+        total_amount, outstanding_amount, collected_amount, waived_amount
+    ) = _fine_totals(db, fingerprint)
+    
+    # Recent collections (last 30 days) are the volatile slice, computed live
+    recent_collections = db.query(func.coalesce(func.sum(Fine.amount), 0)).filter(
+        and_(Fine.is_paid, Fine.paid_date >= _recent_collections_since())
+    ).scalar()
     
     # Top borrowers with fines
     top_fine_users = db.query(
@@ -234,7 +165,7 @@ def get_fine_statistics(
         User.email,
         func.sum(Fine.amount).label('total_fines'),
         func.count(Fine.id).label('fine_count')
-    ).join(Fine).filter(Fine.is_paid == False).group_by(
+    ).join(Fine).filter(Fine.is_outstanding).group_by(
         User.id, User.full_name, User.email
     ).order_by(func.sum(Fine.amount).desc()).limit(5).all()
     
@@ -247,6 +178,7 @@ def get_fine_statistics(
         "collected_amount": round(collected_amount, 2),
         "collection_rate": round((collected_amount / total_amount * 100), 2) if total_amount > 0 else 0,
         "recent_collections_30_days": round(recent_collections, 2),
+        "waived_amount": round(waived_amount, 2),
         "top_fine_users": [
             {
                 "name": user.full_name,
@@ -258,22 +190,53 @@ def get_fine_statistics(
         ]
     }
 
+@router.get("/fines/stats")
+def get_fine_statistics(
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_staff)
+):
+    """Get fine statistics - Staff only"""
+    # The ETag comes from the fines table itself, so a dashboard polling
+    # unchanged statistics gets a 304 without them being computed or read
+    fingerprint = _fines_fingerprint(db)
+    etag = _fingerprint_etag(fingerprint)
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    content = _stats_cache.get(lambda: orjson.dumps(_compute_fine_statistics(db, fingerprint)), key=fingerprint)
+    return Response(content=content, media_type="application/json", headers={"ETag": etag})
+
+def _stream_fine_report(report: dict, query, include_user: bool):
+    """Encode the report, writing its fines array while rows are fetched in batches"""
+    yield orjson.dumps(report)[:-1] + b',"fines":['
+    for index, row in enumerate(query.yield_per(1000)):
+        if index:
+            yield b","
+        fine = row._asdict()
+        if include_user:
+            fine["user"] = {"id": fine["user_id"], "full_name": fine.pop("full_name"), "email": fine.pop("email")}
+        yield orjson.dumps(fine)
+    yield b"]}"
+
 @router.get("/fines/report")
 def generate_fine_report(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    include_user: bool = Query(False, description="Embed each fine's user (id, name, email)"),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Generate fine report for a date range - Staff only"""
     
-    query = db.query(Fine)
+    filters = []
     
     # Apply date filters
     if start_date:
         try:
             start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            query = query.filter(Fine.fine_date >= start_dt)
+            filters.append(Fine.fine_date >= start_dt)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -283,22 +246,32 @@ def generate_fine_report(
     if end_date:
         try:
             end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-            query = query.filter(Fine.fine_date < end_dt)
+            filters.append(Fine.fine_date < end_dt)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid end_date format. Use YYYY-MM-DD"
             )
     
-    fines = query.options(joinedload(Fine.user)).all()
-    
-    # Calculate statistics
-    total_fines = len(fines)
-    total_amount = sum(fine.amount for fine in fines)
-    paid_fines = [fine for fine in fines if fine.is_paid]
-    outstanding_fines = [fine for fine in fines if not fine.is_paid]
-    
-    return {
+    # Summary statistics come from one aggregate query, not the streamed rows;
+    # the same query fingerprints the report for conditional requests
+    total_fines, total_amount, paid_fines, outstanding_fines, max_id, last_paid_at = db.query(
+        func.count(Fine.id),
+        func.coalesce(func.sum(Fine.amount), 0),
+        func.count(case((Fine.is_paid, 1))),
+        func.count(case((Fine.is_outstanding, 1))),
+        func.max(Fine.id),
+        func.max(Fine.paid_date)
+    ).filter(*filters).one()
+    
+    # Fines are only ever added or settled, which changes one of these values
+    last_paid = last_paid_at.timestamp() if last_paid_at else 0
+    etag = f'W/"{start_date}-{end_date}-{int(include_user)}-{total_fines}-{max_id or 0}-{paid_fines}-{last_paid}"'
+    
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    report = {
         "report_period": {
             "start_date": start_date,
             "end_date": end_date
@@ -306,9 +279,140 @@ def generate_fine_report(
         "summary": {
             "total_fines": total_fines,
             "total_amount": round(total_amount, 2),
-            "paid_fines": len(paid_fines),
-            "outstanding_fines": len(outstanding_fines),
-            "collection_rate": round((len(paid_fines) / total_fines * 100), 2) if total_fines > 0 else 0
-        },
-        "fines": fines
+            "paid_fines": paid_fines,
+            "outstanding_fines": outstanding_fines,
+            "collection_rate": round((paid_fines / total_fines * 100), 2) if total_fines > 0 else 0
+        }
+    }
+    
+    query = db.query(
+        Fine.id, Fine.user_id, Fine.loan_id, Fine.amount, Fine.reason,
+        Fine.fine_date, Fine.paid_date, Fine.status, Fine.is_paid.label("is_paid")
+    ).filter(*filters)
+    
+    # Only join users when asked for, and only the columns worth reporting
+    if include_user:
+        query = query.join(User, User.id == Fine.user_id).add_columns(User.full_name, User.email)
+    
+    return StreamingResponse(
+        _stream_fine_report(report, query, include_user),
+        media_type="application/json",
+        headers={"ETag": etag}
+    )
+
+@router.get("/fines/{fine_id}", response_model=FineResponse)
+def get_fine_details(
+    fine_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get details of a specific fine"""
+    
+    fine = db.query(Fine).filter(Fine.id == fine_id).first()
+    
+    if not fine:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Fine not found"
+        )
+    
+    # Users can only see their own fines, staff can see all
+    if current_user.role == UserRoleEnum.MEMBER and fine.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return fine
+
+def _unpaid_fine_error(db: Session, fine_id: int, current_user: User, paid_detail: str) -> HTTPException:
+    """Work out why a conditional fine UPDATE matched no row (the rare path)"""
+    fine = db.query(Fine.user_id).filter(Fine.id == fine_id).first()
+    
+    if not fine:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Fine not found"
+        )
+    
+    # Users can only settle their own fines, staff can process any
+    if current_user.role == UserRoleEnum.MEMBER and fine.user_id != current_user.id:
+        return HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=paid_detail
+    )
+
+@router.post("/fines/{fine_id}/pay")
+def pay_fine(
+    fine_id: int,
+    payment: FinePayment,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Pay a fine"""
+    
+    # Process payment in one UPDATE ... RETURNING; the existence, ownership
+    # and already-paid checks are part of its WHERE clause
+    conditions = [Fine.id == fine_id, Fine.is_outstanding]
+    if current_user.role == UserRoleEnum.MEMBER:
+        conditions.append(Fine.user_id == current_user.id)
+    
+    values = {Fine.status: FineStatusEnum.PAID, Fine.paid_date: utcnow()}
+    if payment.notes:
+        values[Fine.notes] = append_note(Fine.notes, f"Payment: {payment.notes}")
+    
+    paid = db.execute(
+        update(Fine).where(*conditions).values(values).returning(Fine.amount, Fine.paid_date),
+        execution_options={"synchronize_session": False}
+    ).first()
+    
+    if paid is None:
+        raise _unpaid_fine_error(db, fine_id, current_user, "Fine already paid")
+    
+    db.commit()
+    
+    return {
+        "message": "Fine paid successfully",
+        "fine_id": fine_id,
+        "amount_paid": paid.amount,
+        "payment_date": paid.paid_date,
+        "payment_method": payment.payment_method
+    }
+
+@router.post("/fines/{fine_id}/waive")
+def waive_fine(
+    fine_id: int,
+    reason: str = Query(..., description="Reason for waiving the fine"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_staff)
+):
+    """Waive a fine - Staff only"""
+    
+    # Waive the fine; it no longer counts as outstanding, and the status keeps
+    # it apart from paid fines in the statistics
+    waived = db.execute(
+        update(Fine).where(Fine.id == fine_id, Fine.is_outstanding).values({
+            Fine.status: FineStatusEnum.WAIVED,
+            Fine.paid_date: utcnow(),
+            Fine.notes: append_note(Fine.notes, f"Waived by {current_user.full_name}: {reason}")
+        }).returning(Fine.amount),
+        execution_options={"synchronize_session": False}
+    ).first()
+    
+    if waived is None:
+        raise _unpaid_fine_error(db, fine_id, current_user, "Cannot waive a fine that has already been paid")
+    
+    db.commit()
+    
+    return {
+        "message": "Fine waived successfully",
+        "fine_id": fine_id,
+        "waived_amount": waived.amount,
+        "waived_by": current_user.full_name,
+        "reason": reason
     }
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.orm import Session, joinedload, lazyload, raiseload, selectinload
+from sqlalchemy import func, and_, or_, case, insert, literal, select
 from typing import List, Optional
 from datetime import datetime, timedelta
-from models import HoldCreate, HoldResponse, HoldCancel, UserRole
-from auth import get_current_user, require_role
+from models import HoldCreate, HoldResponse, HoldCancel
+from auth import get_current_user, require_staff
+from crud import CachedResult, append_note, book_exists
 from database import (
     get_db, User, Book, BookCopy, Hold, Loan,
-    HoldStatusEnum, LoanStatusEnum, UserRoleEnum
+    HoldStatusEnum, LoanStatusEnum, UserRoleEnum, days_between
 )
 
 router = APIRouter()
@@ -15,6 +17,14 @@ router = APIRouter()
 # Configuration constants
 HOLD_EXPIRY_DAYS = 7  # How long a hold is kept when book becomes available
 
+# Enum members keyed by their string values, for request validation
+_HOLD_STATUSES = {s.value: s for s in HoldStatusEnum}
+
+# Hold statistics, recomputed at most once a minute per worker. Nothing
+# clears it when holds change, so each worker can serve figures up to that
+# minute old
+_stats_cache = CachedResult(ttl=60)
+
 @router.post("/holds", response_model=HoldResponse)
 def place_hold(
     hold_request: HoldCreate,
@@ -23,8 +33,32 @@ def place_hold(
 ):
     """Place a hold on a book"""
     
-    # Get the book
-    book = db.query(Book).filter(Book.id == hold_request.book_id).first()
+    book_id = hold_request.book_id
+    
+    # Everything the checks need in one query: the book's availability and
+    # whether the user already holds or has borrowed it. The book row is
+    # locked so concurrent holds on it queue up one at a time (PostgreSQL;
+    # SQLite already serializes writers)
+    has_active_hold = select(Hold.id).where(
+        and_(
+            Hold.user_id == current_user.id,
+            Hold.book_id == book_id,
+            Hold.status == HoldStatusEnum.ACTIVE
+        )
+    ).exists()
+    has_active_loan = select(Loan.id).join(BookCopy).where(
+        and_(
+            Loan.user_id == current_user.id,
+            BookCopy.book_id == book_id,
+            Loan.status == LoanStatusEnum.ACTIVE
+        )
+    ).exists()
+    
+    book = db.query(
+        Book.available_copies,
+        has_active_hold.label("has_active_hold"),
+        has_active_loan.label("has_active_loan")
+    ).filter(Book.id == book_id).with_for_update(of=Book).first()
     
     if not book:
         raise HTTPException(
@@ -40,54 +74,37 @@ def place_hold(
         )
     
     # Check if user already has an active hold on this book
-    existing_hold = db.query(Hold).filter(
-        and_(
-            Hold.user_id == current_user.id,
-            Hold.book_id == book.id,
-            Hold.status == HoldStatusEnum.ACTIVE
-        )
-    ).first()
-    
-    if existing_hold:
+    if book.has_active_hold:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="You already have an active hold on this book"
         )
     
     # Check if user currently has this book checked out
-    active_loan = db.query(Loan).join(BookCopy).filter(
-        and_(
-            Loan.user_id == current_user.id,
-            BookCopy.book_id == book.id,
-            Loan.status == LoanStatusEnum.ACTIVE
-        )
-    ).first()
-    
-    if active_loan:
+    if book.has_active_loan:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="You currently have this book checked out"
         )
     
-    # Calculate queue position
-    queue_position = db.query(Hold).filter(
-        and_(Hold.book_id == book.id, Hold.status == HoldStatusEnum.ACTIVE)
-    ).count() + 1
-    
-    # Create the hold
-    hold = Hold(
-        user_id=current_user.id,
-        book_id=book.id,
-        queue_position=queue_position,
-        status=HoldStatusEnum.ACTIVE,
-        notes=hold_request.notes
-    )
-    
-    db.add(hold)
+    # Create the hold at the back of the queue; the position is computed by
+    # the same statement that inserts the row
+    next_position = select(
+        literal(current_user.id),
+        literal(book_id),
+        func.coalesce(func.max(Hold.queue_position), 0) + 1,
+        literal(HoldStatusEnum.ACTIVE, Hold.status.type),
+        literal(hold_request.notes, Hold.notes.type)
+    ).where(and_(Hold.book_id == book_id, Hold.status == HoldStatusEnum.ACTIVE))
+    
+    hold_id = db.execute(
+        insert(Hold).from_select(
+            [Hold.user_id, Hold.book_id, Hold.queue_position, Hold.status, Hold.notes], next_position
+        ).returning(Hold.id)
+    ).scalar_one()
     db.commit()
-    db.refresh(hold)
     
-    return hold
+    return db.get(Hold, hold_id)
 
 @router.get("/holds", response_model=List[HoldResponse])
 def get_user_holds(
@@ -97,24 +114,122 @@ def get_user_holds(
 ):
     """Get current user's holds"""
     
+    # get_current_user already loaded the owner into this session, so each
+    # row's user comes from the identity map without a query; anything else
+    # unloaded raises instead of lazy-loading once per row
     query = db.query(Hold).options(
-        joinedload(Hold.book)
+        selectinload(Hold.book),
+        lazyload(Hold.user),
+        raiseload('*')
     ).filter(Hold.user_id == current_user.id)
     
     # Apply status filter
     if status_filter:
-        try:
-            status_enum = HoldStatusEnum(status_filter)
-            query = query.filter(Hold.status == status_enum)
-        except ValueError:
+        status_enum = _HOLD_STATUSES.get(status_filter)
+        if status_enum is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid status. Valid options: {list(_HOLD_STATUSES)}"
+            )
+        query = query.filter(Hold.status == status_enum)
+    
+    holds = query.order_by(Hold.hold_date.desc(), Hold.id.desc()).all()
+    return holds
+
+# Staff-only endpoints
+@router.get("/holds/all", response_model=List[HoldResponse])
+def get_all_holds(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    status_filter: Optional[str] = Query(None),
+    book_id: Optional[int] = Query(None, description="Filter by book ID"),
+    user_id: Optional[int] = Query(None, description="Filter by user ID"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_staff)
+):
+    """Get all holds - Staff only"""
+    
+    query = db.query(Hold).options(
+        selectinload(Hold.user),
+        selectinload(Hold.book),
+        raiseload('*')
+    )
+    
+    # Apply filters
+    if status_filter:
+        status_enum = _HOLD_STATUSES.get(status_filter)
+        if status_enum is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid status. Valid options: {[s.value for s in HoldStatusEnum]}"
+                detail=f"Invalid status. Valid options: {list(_HOLD_STATUSES)}"
             )
+        query = query.filter(Hold.status == status_enum)
+    
+    if book_id:
+        query = query.filter(Hold.book_id == book_id)
+    
+    if user_id:
+        query = query.filter(Hold.user_id == user_id)
     
-    holds = query.order_by(Hold.hold_date.desc()).all()
+    holds = query.order_by(Hold.hold_date.desc(), Hold.id.desc()).offset(skip).limit(limit).all()
     return holds
 
+def _compute_hold_statistics(db: Session) -> dict:
+    """Aggregate hold counts, wait times and most requested books"""
+    # Per-status counts in one pass; expired holds (fulfilled but not picked
+    # up) are counted alongside as a conditional aggregate
+    counts = {}
+    expired_holds = 0
+    for hold_status, count, expired in db.query(
+        Hold.status,
+        func.count(Hold.id),
+        func.count(case((Hold.expiry_date < datetime.utcnow(), 1)))
+    ).group_by(Hold.status):
+        counts[hold_status] = count
+        if hold_status == HoldStatusEnum.FULFILLED:
+            expired_holds = expired
+    
+    total_holds = sum(counts.values())
+    active_holds = counts.get(HoldStatusEnum.ACTIVE, 0)
+    fulfilled_holds = counts.get(HoldStatusEnum.FULFILLED, 0)
+    
+    # Most requested books
+    popular_books = db.query(
+        Book.title,
+        Book.author,
+        func.count(Hold.id).label('hold_count')
+    ).join(Hold).group_by(Book.id, Book.title, Book.author).order_by(
+        func.count(Hold.id).desc()
+    ).limit(5).all()
+    
+    # Average wait time (for fulfilled holds)
+    avg_wait_result = db.query(
+        func.avg(days_between(Hold.hold_date, Hold.fulfilled_date))
+    ).filter(Hold.status == HoldStatusEnum.FULFILLED).scalar()
+    
+    avg_wait_days = round(float(avg_wait_result), 1) if avg_wait_result else 0
+    
+    return {
+        "total_holds": total_holds,
+        "active_holds": active_holds,
+        "fulfilled_holds": fulfilled_holds,
+        "expired_holds": expired_holds,
+        "average_wait_days": avg_wait_days,
+        "most_requested_books": [
+            {"title": book.title, "author": book.author, "hold_count": book.hold_count}
+            for book in popular_books
+        ]
+    }
+
+@router.get("/holds/stats")
+def get_hold_statistics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_staff)
+):
+    """Get hold statistics - Staff only"""
+    content = _stats_cache.get(lambda: orjson.dumps(_compute_hold_statistics(db)))
+    return Response(content=content, media_type="application/json")
+
 @router.get("/holds/{hold_id}", response_model=HoldResponse)
 def get_hold_details(
     hold_id: int,
@@ -142,7 +257,7 @@ def get_hold_details(
     
     return hold
 
-@router.put("/holds/{hold_id}/cancel", response_model=dict)
+@router.put("/holds/{hold_id}/cancel")
 def cancel_hold(
     hold_id: int,
     cancel_request: HoldCancel,
@@ -175,23 +290,21 @@ def cancel_hold(
             detail="Only active holds can be cancelled"
         )
     
-    # Cancel the hold
-    hold.status = HoldStatusEnum.CANCELLED
-    
+    # Cancel the hold, adding the reason to its notes in the same UPDATE
+    values = {Hold.status: HoldStatusEnum.CANCELLED}
     if cancel_request.reason:
-        hold.notes = f"{hold.notes or ''}\nCancelled: {cancel_request.reason}".strip()
+        values[Hold.notes] = append_note(Hold.notes, f"Cancelled: {cancel_request.reason}")
+    
+    db.query(Hold).filter(Hold.id == hold_id).update(values, synchronize_session=False)
     
-    # Update queue positions for remaining holds
-    remaining_holds = db.query(Hold).filter(
+    # Move the remaining holds up one place in a single UPDATE
+    db.query(Hold).filter(
         and_(
             Hold.book_id == hold.book_id,
             Hold.status == HoldStatusEnum.ACTIVE,
             Hold.queue_position > hold.queue_position
         )
-    ).all()
-    
-    for remaining_hold in remaining_holds:
-        remaining_hold.queue_position -= 1
+    ).update({Hold.queue_position: Hold.queue_position - 1}, synchronize_session=False)
     
     db.commit()
     
@@ -201,49 +314,11 @@ def cancel_hold(
         "cancelled_at": datetime.utcnow()
     }
 
-# Staff-only endpoints
-@router.get("/holds/all", response_model=List[HoldResponse])
-def get_all_holds(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(50, ge=1, le=100),
-    status_filter: Optional[str] = Query(None),
-    book_id: Optional[int] = Query(None, description="Filter by book ID"),
-    user_id: Optional[int] = Query(None, description="Filter by user ID"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
-):
-    """Get all holds - Staff only"""
-    
-    query = db.query(Hold).options(
-        joinedload(Hold.user),
-        joinedload(Hold.book)
-    )
-    
-    # Apply filters
-    if status_filter:
-        try:
-            status_enum = HoldStatusEnum(status_filter)
-            query = query.filter(Hold.status == status_enum)
-        except ValueError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid status. Valid options: {[s.value for s in HoldStatusEnum]}"
-            )
-    
-    if book_id:
-        query = query.filter(Hold.book_id == book_id)
-    
-    if user_id:
-        query = query.filter(Hold.user_id == user_id)
-    
-    holds = query.order_by(Hold.hold_date.desc()).offset(skip).limit(limit).all()
-    return holds
-
 @router.put("/holds/{hold_id}/fulfill")
 def fulfill_hold(
     hold_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Mark a hold as fulfilled when book becomes available - Staff only"""
     
@@ -287,20 +362,18 @@ def fulfill_hold(
     
     # Mark hold as fulfilled
     hold.status = HoldStatusEnum.FULFILLED
-    hold.fulfilled_date = datetime.utcnow()
-    hold.expiry_date = datetime.utcnow() + timedelta(days=HOLD_EXPIRY_DAYS)
+    now = datetime.utcnow()
+    hold.fulfilled_date = now
+    hold.expiry_date = now + timedelta(days=HOLD_EXPIRY_DAYS)
     
-    # Update queue positions for remaining holds
-    remaining_holds = db.query(Hold).filter(
+    # Move the remaining holds up one place in a single UPDATE
+    db.query(Hold).filter(
         and_(
             Hold.book_id == hold.book_id,
             Hold.status == HoldStatusEnum.ACTIVE,
             Hold.queue_position > hold.queue_position
         )
-    ).all()
-    
-    for remaining_hold in remaining_holds:
-        remaining_hold.queue_position -= 1
+    ).update({Hold.queue_position: Hold.queue_position - 1}, synchronize_session=False)
     
     db.commit()
     
@@ -312,70 +385,24 @@ def fulfill_hold(
         "pickup_instructions": "Please pick up your reserved book within 7 days"
     }
 
-@router.get("/holds/stats")
-def get_hold_statistics(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
-):
-    """Get hold statistics - Staff only"""
-    
-    total_holds = db.query(Hold).count()
-    active_holds = db.query(Hold).filter(Hold.status == HoldStatusEnum.ACTIVE).count()
-    fulfilled_holds = db.query(Hold).filter(Hold.status == HoldStatusEnum.FULFILLED).count()
-    
-    # Expired holds (fulfilled but not picked up)
-    expired_holds = db.query(Hold).filter(
-        and_(
-            Hold.status == HoldStatusEnum.FULFILLED,
-            Hold.expiry_date < datetime.utcnow()
-        )
-    ).count()
-    
-    # Most requested books
-    popular_books = db.query(
-        Book.title,
-        Book.author,
-        func.count(Hold.id).label('hold_count')
-    ).join(Hold).group_by(Book.id, Book.title, Book.author).order_by(
-        func.count(Hold.id).desc()
-    ).limit(5).all()
-    
-    # Average wait time (for fulfilled holds)
-    avg_wait_result = db.query(
-        func.avg(func.extract('day', Hold.fulfilled_date - Hold.hold_date))
-    ).filter(Hold.status == HoldStatusEnum.FULFILLED).scalar()
-    
-    avg_wait_days = round(avg_wait_result, 1) if avg_wait_result else 0
-    
-    return {
-        "total_holds": total_holds,
-        "active_holds": active_holds,
-        "fulfilled_holds": fulfilled_holds,
-        "expired_holds": expired_holds,
-        "average_wait_days": avg_wait_days,
-        "most_requested_books": [
-            {"title": book.title, "author": book.author, "hold_count": book.hold_count}
-            for book in popular_books
-        ]
-    }
-
 @router.get("/books/{book_id}/holds", response_model=List[HoldResponse])
 def get_book_holds(
     book_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Get all holds for a specific book - Staff only"""
     
-    book = db.query(Book).filter(Book.id == book_id).first()
-    if not book:
+    if not book_exists(db, book_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Book not found"
         )
     
     holds = db.query(Hold).options(
-        joinedload(Hold.user)
+        selectinload(Hold.user),
+        selectinload(Hold.book),
+        raiseload('*')
     ).filter(Hold.book_id == book_id).order_by(Hold.queue_position).all()
     
     return holds
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.orm import Session, joinedload, lazyload, raiseload, selectinload
+from sqlalchemy import func, and_, or_, select
 from typing import List, Optional
+from pydantic import TypeAdapter
 from datetime import datetime, timedelta
-from models import LoanCreate, LoanResponse, LoanRenew, LoanReturn, UserRole
-from auth import get_current_user, require_role
+from models import LoanCreate, LoanResponse, LoanRenew, LoanReturn, to_response
+from auth import OwnerOrStaff, get_current_user, require_staff
+from crud import CachedResult, cached_json_response
 from database import (
     get_db, User, Book, BookCopy, Loan, Fine,
-    LoanStatusEnum, BookCopyStatusEnum, UserRoleEnum
+    LoanStatusEnum, BookCopyStatusEnum, FineStatusEnum, UserRoleEnum, days_between
 )
 
 router = APIRouter()
@@ -18,6 +21,30 @@ MAX_RENEWALS = 2
 MAX_ACTIVE_LOANS_PER_USER = 5
 OVERDUE_FINE_PER_DAY = 0.50
 
+# Serializer for the staff loan list, built once and reused by every request
+_LOANS_TA = TypeAdapter(List[LoanResponse])
+
+# Loan statistics, recomputed at most once a minute per worker; the last
+# result is served for up to an hour when recomputing it hits a database
+# error. Callers are still authorized against the users table first
+_stats_cache = CachedResult(ttl=60, stale_ttl=3600)
+
+# The most borrowed books rank every loan ever made and barely move within
+# an hour, so they are kept far longer than the rest of the statistics
+_popular_books_cache = CachedResult(ttl=3600)
+
+# Single-loan lookups by path id, limited to the borrower and staff. The
+# details view embeds the borrower (never their password hash) and the copy;
+# the write paths also need the copy's book
+_viewable_loan = OwnerOrStaff(Loan, "loan_id", "Loan not found", options=(
+    joinedload(Loan.book_copy),
+    joinedload(Loan.user).defer(User.hashed_password, raiseload=True),
+    raiseload('*')
+))
+_writable_loan = OwnerOrStaff(Loan, "loan_id", "Loan not found", options=(
+    joinedload(Loan.book_copy).joinedload(BookCopy.book),
+))
+
 @router.post("/loans", response_model=LoanResponse)
 def borrow_book(
     loan_request: LoanCreate,
@@ -26,17 +53,33 @@ def borrow_book(
 ):
     """Borrow a book - creates a new loan"""
     
-    # Get the book copy
-    book_copy = db.query(BookCopy).options(joinedload(BookCopy.book)).filter(
+    # The copy and everything the checks need in one query: how many loans
+    # the user has out and whether they owe anything. The copy row is locked
+    # so two borrowers can't both see it available (PostgreSQL; SQLite
+    # already serializes writers)
+    active_loans = select(func.count(Loan.id)).where(
+        and_(Loan.user_id == current_user.id, Loan.status == LoanStatusEnum.ACTIVE)
+    ).scalar_subquery()
+    has_unpaid_fines = select(Fine.id).where(
+        and_(Fine.user_id == current_user.id, Fine.is_outstanding)
+    ).exists()
+    
+    row = db.query(
+        BookCopy,
+        active_loans.label("active_loans"),
+        has_unpaid_fines.label("has_unpaid_fines")
+    ).filter(
         BookCopy.id == loan_request.book_copy_id
-    ).first()
+    ).with_for_update(of=BookCopy).first()
     
-    if not book_copy:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Book copy not found"
         )
     
+    book_copy = row.BookCopy
+    
     # Check if copy is available
     if book_copy.status != BookCopyStatusEnum.AVAILABLE:
         raise HTTPException(
@@ -45,27 +88,30 @@ def borrow_book(
         )
     
     # Check user's active loan limit
-    active_loans = db.query(Loan).filter(
-        and_(Loan.user_id == current_user.id, Loan.status == LoanStatusEnum.ACTIVE)
-    ).count()
-    
-    if active_loans >= MAX_ACTIVE_LOANS_PER_USER:
+    if row.active_loans >= MAX_ACTIVE_LOANS_PER_USER:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Maximum loan limit reached ({MAX_ACTIVE_LOANS_PER_USER} books)"
         )
     
     # Check for outstanding fines (members can't borrow with unpaid fines)
-    if current_user.role == UserRoleEnum.MEMBER:
-        unpaid_fines = db.query(Fine).filter(
-            and_(Fine.user_id == current_user.id, Fine.is_paid == False)
-        ).count()
-        
-        if unpaid_fines > 0:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Cannot borrow books with outstanding fines. Please pay fines first."
-            )
+    if current_user.role == UserRoleEnum.MEMBER and row.has_unpaid_fines:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot borrow books with outstanding fines. Please pay fines first."
+        )
+    
+    # Take one off the book's availability in the same statement that checks
+    # it, so concurrent borrows of other copies can't lose an update
+    taken = db.query(Book).filter(
+        and_(Book.id == book_copy.book_id, Book.available_copies > 0)
+    ).update({Book.available_copies: Book.available_copies - 1}, synchronize_session=False)
+    
+    if not taken:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="No copies of this book are available"
+        )
     
     # Create the loan
     due_date = datetime.utcnow() + timedelta(days=LOAN_PERIOD_DAYS)
@@ -80,14 +126,11 @@ def borrow_book(
     # Update book copy status
     book_copy.status = BookCopyStatusEnum.CHECKED_OUT
     
-    # Update book availability count
-    book_copy.book.available_copies -= 1
-    
     db.add(loan)
     db.commit()
     db.refresh(loan)
     
-    return loan
+    return to_response(LoanResponse, loan)
 
 @router.get("/loans", response_model=List[LoanResponse])
 def get_user_loans(
@@ -98,8 +141,14 @@ def get_user_loans(
 ):
     """Get current user's loans"""
     
+    # get_current_user already loaded the owner into this session, so each
+    # row's user comes from the identity map without a query; anything else
+    # unloaded raises instead of lazy-loading once per row. LoanResponse embeds the copy but
+    # not its book, so the book isn't loaded
     query = db.query(Loan).options(
-        joinedload(Loan.book_copy).joinedload(BookCopy.book)
+        selectinload(Loan.book_copy),
+        lazyload(Loan.user),
+        raiseload('*')
     ).filter(Loan.user_id == current_user.id)
     
     # Apply status filter
@@ -116,62 +165,139 @@ def get_user_loans(
         # By default, exclude returned loans
         query = query.filter(Loan.status != LoanStatusEnum.RETURNED)
     
-    loans = query.order_by(Loan.loan_date.desc()).all()
+    loans = query.order_by(Loan.loan_date.desc(), Loan.id.desc()).all()
     return loans
 
-@router.get("/loans/{loan_id}", response_model=LoanResponse)
-def get_loan_details(
-    loan_id: int,
+# Staff-only endpoints
+@router.get("/loans/all", response_model=List[LoanResponse])
+def get_all_loans(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    before_id: Optional[int] = Query(None, description="Return loans older than this id (from X-Next-Cursor)"),
+    status_filter: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None, description="Filter by user ID"),
+    overdue_only: bool = Query(False, description="Show only overdue loans"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(require_staff)
 ):
-    """Get details of a specific loan"""
+    """Get all loans - Staff only"""
     
-    loan = db.query(Loan).options(
-        joinedload(Loan.book_copy).joinedload(BookCopy.book)
-    ).filter(Loan.id == loan_id).first()
+    # Only the columns LoanResponse serializes: no password hashes, and no
+    # books behind the copies
+    query = db.query(Loan).options(
+        selectinload(Loan.user).defer(User.hashed_password, raiseload=True),
+        selectinload(Loan.book_copy),
+        raiseload('*')
+    )
     
-    if not loan:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Loan not found"
+    # Apply filters
+    if status_filter:
+        try:
+            status_enum = LoanStatusEnum(status_filter)
+            query = query.filter(Loan.status == status_enum)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid status. Valid options: {[s.value for s in LoanStatusEnum]}"
+            )
+    
+    if user_id:
+        query = query.filter(Loan.user_id == user_id)
+    
+    if overdue_only:
+        query = query.filter(
+            and_(
+                Loan.status == LoanStatusEnum.ACTIVE,
+                Loan.due_date < datetime.utcnow()
+            )
         )
     
-    # Users can only see their own loans, staff can see all
-    if current_user.role == UserRoleEnum.MEMBER and loan.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
+    if before_id is not None:
+        query = query.filter(Loan.id < before_id)
+    
+    # Keyset pagination: ids grow with loan_date, so newest-first by id is an
+    # index range scan no matter how deep the client pages
+    loans = query.order_by(Loan.id.desc()).offset(skip).limit(limit).all()
+    headers = {"X-Next-Cursor": str(loans[-1].id)} if len(loans) == limit else None
+    return Response(
+        content=_LOANS_TA.dump_json([to_response(LoanResponse, loan) for loan in loans]),
+        media_type="application/json",
+        headers=headers
+    )
+
+def _compute_popular_books(db: Session) -> list:
+    """Five most borrowed books by loan count"""
+    popular_books = db.query(
+        Book.title,
+        Book.author,
+        func.count(Loan.id).label('loan_count')
+    ).select_from(Book).join(
+        BookCopy, BookCopy.book_id == Book.id
+    ).join(
+        Loan, Loan.book_copy_id == BookCopy.id
+    ).group_by(Book.id, Book.title, Book.author).order_by(
+        func.count(Loan.id).desc()
+    ).limit(5).all()
+    
+    return [
+        {"title": book.title, "author": book.author, "loan_count": book.loan_count}
+        for book in popular_books
+    ]
+
+def _popular_books(db: Session) -> list:
+    """Five most borrowed books by loan count, kept for an hour"""
+    return _popular_books_cache.get(lambda: _compute_popular_books(db))
+
+def _compute_loan_statistics(db: Session) -> dict:
+    """Aggregate loan counts, durations and most borrowed books"""
+    total_loans = db.query(Loan).count()
+    active_loans = db.query(Loan).filter(Loan.status == LoanStatusEnum.ACTIVE).count()
+    
+    # Overdue loans
+    overdue_loans = db.query(Loan).filter(
+        and_(
+            Loan.status == LoanStatusEnum.ACTIVE,
+            Loan.due_date < datetime.utcnow()
         )
+    ).count()
+    
+    # Average loan duration for returned books
+    avg_duration_result = db.query(
+        func.avg(days_between(Loan.loan_date, Loan.return_date))
+    ).filter(Loan.status == LoanStatusEnum.RETURNED).scalar()
     
-    return loan
+    avg_loan_duration = round(float(avg_duration_result), 1) if avg_duration_result else 0
+    
+    return {
+        "total_loans": total_loans,
+        "active_loans": active_loans,
+        "overdue_loans": overdue_loans,
+        "overdue_percentage": round((overdue_loans / active_loans * 100), 2) if active_loans > 0 else 0,
+        "average_loan_duration_days": avg_loan_duration,
+        "most_popular_books": _popular_books(db)
+    }
+
+@router.get("/loans/stats")
+def get_loan_statistics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_staff)
+):
+    """Get loan statistics - Staff only"""
+    return cached_json_response(_stats_cache, lambda: orjson.dumps(_compute_loan_statistics(db)))
+
+@router.get("/loans/{loan_id}", response_model=LoanResponse)
+def get_loan_details(loan: Loan = Depends(_viewable_loan)):
+    """Get details of a specific loan"""
+    return to_response(LoanResponse, loan)
 
 @router.put("/loans/{loan_id}/renew", response_model=LoanResponse)
 def renew_loan(
-    loan_id: int,
     renewal_request: LoanRenew,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    loan: Loan = Depends(_writable_loan),
+    db: Session = Depends(get_db)
 ):
     """Renew a loan - extends due date"""
     
-    loan = db.query(Loan).options(
-        joinedload(Loan.book_copy).joinedload(BookCopy.book)
-    ).filter(Loan.id == loan_id).first()
-    
-    if not loan:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Loan not found"
-        )
-    
-    # Users can only renew their own loans
-    if current_user.role == UserRoleEnum.MEMBER and loan.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    
     # Check if loan is active
     if loan.status != LoanStatusEnum.ACTIVE:
         raise HTTPException(
@@ -211,33 +337,16 @@ def renew_loan(
     db.commit()
     db.refresh(loan)
     
-    return loan
+    return to_response(LoanResponse, loan)
 
-@router.put("/loans/{loan_id}/return", response_model=dict)
-def return_book(
-    loan_id: int,
+def _process_return(
+    db: Session,
+    loan: Loan,
     return_request: LoanReturn,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Return a borrowed book"""
-    
-    loan = db.query(Loan).options(
-        joinedload(Loan.book_copy).joinedload(BookCopy.book)
-    ).filter(Loan.id == loan_id).first()
-    
-    if not loan:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Loan not found"
-        )
-    
-    # Members can only return their own books, staff can process any return
-    if current_user.role == UserRoleEnum.MEMBER and loan.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    current_user: User,
+    waive_fines: bool = False
+) -> dict:
+    """Return a loan in one transaction, charging or waiving any overdue fine"""
     
     # Check if already returned
     if loan.status == LoanStatusEnum.RETURNED:
@@ -255,22 +364,19 @@ def return_book(
         days_overdue = (return_date - loan.due_date).days
         fine_amount = days_overdue * OVERDUE_FINE_PER_DAY
         
-        # Create overdue fine
+        # Create overdue fine; a waived fine is written already settled
+        # rather than inserted unpaid and updated afterwards
         fine = Fine(
             user_id=loan.user_id,
             loan_id=loan.id,
             amount=fine_amount,
-            reason="overdue",
-            fine_date=return_date
+            reason="overdue"
         )
+        if waive_fines:
+            fine.status = FineStatusEnum.WAIVED
+            fine.paid_date = return_date
+            fine.notes = f"Waived by {current_user.full_name} on return"
         db.add(fine)
-        
-        # Send fine notification
-        try:
-            from notification_service import notify_fine_notice
-            notify_fine_notice(db, loan.user_id, fine_amount, "overdue book return")
-        except Exception as e:
-            print(f"Error sending fine notification: {e}")
     
     # Update loan
     loan.return_date = return_date
@@ -290,6 +396,14 @@ def return_book(
     
     db.commit()
     
+    # Notifications commit on their own, so they go out once the return is saved
+    if is_overdue and not waive_fines:
+        try:
+            from notification_service import notify_fine_notice
+            notify_fine_notice(db, loan.user_id, fine_amount, "overdue book return")
+        except Exception as e:
+            print(f"Error sending fine notification: {e}")
+    
     # Send notifications to users with holds for this book
     try:
         from notification_service import notify_book_available
@@ -299,7 +413,7 @@ def return_book(
         print(f"Error sending book available notifications: {e}")
         notifications_sent = []
     
-    return {
+    result = {
         "message": "Book returned successfully",
         "return_date": return_date,
         "was_overdue": is_overdue,
@@ -307,122 +421,30 @@ def return_book(
         "fine_amount": fine_amount,
         "book_title": loan.book_copy.book.title
     }
-
-# Staff-only endpoints
-@router.get("/loans/all", response_model=List[LoanResponse])
-def get_all_loans(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(50, ge=1, le=100),
-    status_filter: Optional[str] = Query(None),
-    user_id: Optional[int] = Query(None, description="Filter by user ID"),
-    overdue_only: bool = Query(False, description="Show only overdue loans"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
-):
-    """Get all loans - Staff only"""
-    
-    query = db.query(Loan).options(
-        joinedload(Loan.user),
-        joinedload(Loan.book_copy).joinedload(BookCopy.book)
-    )
-    
-    # Apply filters
-    if status_filter:
-        try:
-            status_enum = LoanStatusEnum(status_filter)
-            query = query.filter(Loan.status == status_enum)
-        except ValueError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid status. Valid options: {[s.value for s in LoanStatusEnum]}"
-            )
-    
-    if user_id:
-        query = query.filter(Loan.user_id == user_id)
     
-    if overdue_only:
-        query = query.filter(
-            and_(
-                Loan.status == LoanStatusEnum.ACTIVE,
-                Loan.due_date < datetime.utcnow()
-            )
-        )
+    if waive_fines and fine_amount > 0:
+        result["fine_waived"] = True
+        result["fine_amount"] = 0.0
     
-    loans = query.order_by(Loan.loan_date.desc()).offset(skip).limit(limit).all()
-    return loans
+    return result
 
-@router.get("/loans/stats")
-def get_loan_statistics(
+@router.put("/loans/{loan_id}/return")
+def return_book(
+    return_request: LoanReturn,
+    loan: Loan = Depends(_writable_loan),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(get_current_user)
 ):
-    """Get loan statistics - Staff only"""
-    
-    total_loans = db.query(Loan).count()
-    active_loans = db.query(Loan).filter(Loan.status == LoanStatusEnum.ACTIVE).count()
-    
-    # Overdue loans
-    overdue_loans = db.query(Loan).filter(
-        and_(
-            Loan.status == LoanStatusEnum.ACTIVE,
-            Loan.due_date < datetime.utcnow()
-        )
-    ).count()
-    
-    # Average loan duration for returned books
-    avg_duration_result = db.query(
-        func.avg(func.extract('day', Loan.return_date - Loan.loan_date))
-    ).filter(Loan.status == LoanStatusEnum.RETURNED).scalar()
-    
-    avg_loan_duration = round(avg_duration_result, 1) if avg_duration_result else 0
-    
-    # Most popular books (by loan count)
-    popular_books = db.query(
-        Book.title,
-        Book.author,
-        func.count(Loan.id).label('loan_count')
-    ).join(BookCopy).join(Loan).group_by(Book.id, Book.title, Book.author).order_by(
-        func.count(Loan.id).desc()
-    ).limit(5).all()
-    
-    return {
-        "total_loans": total_loans,
-        "active_loans": active_loans,
-        "overdue_loans": overdue_loans,
-        "overdue_percentage": round((overdue_loans / active_loans * 100), 2) if active_loans > 0 else 0,
-        "average_loan_duration_days": avg_loan_duration,
-        "most_popular_books": [
-            {"title": book.title, "author": book.author, "loan_count": book.loan_count}
-            for book in popular_books
-        ]
-    }
+    """Return a borrowed book"""
+    return _process_return(db, loan, return_request, current_user)
 
 @router.put("/loans/{loan_id}/admin-return")
 def admin_return_book(
-    loan_id: int,
     return_request: LoanReturn,
     waive_fines: bool = Query(False, description="Waive any overdue fines"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff),
+    loan: Loan = Depends(_writable_loan),
+    db: Session = Depends(get_db)
 ):
     """Admin/Librarian return a book - can waive fines"""
-    
-    # Use the regular return function but with admin privileges
-    result = return_book(loan_id, return_request, db, current_user)
-    
-    # If there was a fine and admin wants to waive it
-    if waive_fines and result["fine_amount"] > 0:
-        # Find and mark the fine as paid
-        fine = db.query(Fine).filter(
-            and_(Fine.loan_id == loan_id, Fine.is_paid == False)
-        ).first()
-        
-        if fine:
-            fine.is_paid = True
-            fine.paid_date = datetime.utcnow()
-            db.commit()
-            
-            result["fine_waived"] = True
-            result["fine_amount"] = 0.0
-    
-    return result
+    return _process_return(db, loan, return_request, current_user, waive_fines=waive_fines)
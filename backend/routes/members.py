@@ -1,25 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.orm import Session, defer, joinedload, lazyload, raiseload, selectinload
+from sqlalchemy import func, and_, or_, select
 from typing import List, Optional
 from datetime import datetime, timedelta
 from models import (
     UserCreate, UserResponse, UserUpdate, MembershipStats, 
-    UserRole, LoanResponse, HoldResponse, FineResponse
+    LoanResponse, HoldResponse, FineResponse
 )
-from auth import get_current_user, require_role, hash_password
+from auth import OwnerOrStaff, get_current_user, require_staff, hash_password
+from crud import CachedResult, append_note, cached_json_response
 from database import (
-    get_db, User, Book, BookCopy, Loan, Hold, Fine,
+    get_db, User, Book, Loan, Hold, Fine,
     UserRoleEnum, LoanStatusEnum, HoldStatusEnum
 )
 
 router = APIRouter()
 
+# Membership statistics, recomputed at most once a minute per worker; the
+# last result is served for up to an hour when recomputing it hits a
+# database error. Callers are still authorized against the users table first
+_stats_cache = CachedResult(ttl=60, stale_ttl=3600)
+
+# Top borrowers rank a month of loans and barely move within an hour, so
+# they are kept far longer than the rest of the statistics
+_top_borrowers_cache = CachedResult(ttl=3600)
+
+# A member's own record, or anyone's for staff
+_visible_member = OwnerOrStaff(User, "member_id", "Member not found", owner_col="id")
+
 @router.post("/members", response_model=UserResponse)
 def create_member(
     user_data: UserCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Create a new library member - Staff only"""
     
@@ -53,17 +67,20 @@ def create_member(
 
 @router.get("/members", response_model=List[UserResponse])
 def get_all_members(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    before_id: Optional[int] = Query(None, description="Return members who joined before this id (from X-Next-Cursor)"),
     search: Optional[str] = Query(None, description="Search by name or email"),
     role_filter: Optional[str] = Query(None, description="Filter by role"),
     active_only: bool = Query(True, description="Show only active members"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Get all library members - Staff only"""
     
-    query = db.query(User)
+    # UserResponse never includes the password hash, so don't fetch it
+    query = db.query(User).options(defer(User.hashed_password, raiseload=True))
     
     # Apply filters
     if search:
@@ -88,60 +105,104 @@ def get_all_members(
     if active_only:
         query = query.filter(User.is_active == True)
     
-    members = query.order_by(User.membership_date.desc()).offset(skip).limit(limit).all()
+    if before_id is not None:
+        query = query.filter(User.id < before_id)
+    
+    # Keyset pagination: ids grow with membership_date, so newest-first by id
+    # is an index range scan no matter how deep the client pages
+    members = query.order_by(User.id.desc()).offset(skip).limit(limit).all()
+    if len(members) == limit:
+        response.headers["X-Next-Cursor"] = str(members[-1].id)
     return members
 
-@router.get("/members/{member_id}", response_model=UserResponse)
-def get_member_details(
-    member_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get member details"""
+def _compute_top_borrowers(db: Session) -> list:
+    """Five members with the most loans in the last 30 days"""
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    top_borrowers = db.query(
+        User.full_name,
+        User.email,
+        func.count(Loan.id).label('loan_count')
+    ).join(Loan).filter(
+        Loan.loan_date >= thirty_days_ago
+    ).group_by(User.id, User.full_name, User.email).order_by(
+        func.count(Loan.id).desc()
+    ).limit(5).all()
     
-    member = db.query(User).filter(User.id == member_id).first()
+    return [
+        {
+            "name": borrower.full_name,
+            "email": borrower.email,
+            "loan_count": borrower.loan_count
+        }
+        for borrower in top_borrowers
+    ]
+
+def _top_borrowers(db: Session) -> list:
+    """Five members with the most loans in the last 30 days, kept for an hour"""
+    return _top_borrowers_cache.get(lambda: _compute_top_borrowers(db))
+
+def _compute_membership_statistics(db: Session) -> dict:
+    """Aggregate member counts and top borrowers"""
+    total_members = db.query(User).filter(User.role == UserRoleEnum.MEMBER).count()
+    active_members = db.query(User).filter(
+        and_(User.role == UserRoleEnum.MEMBER, User.is_active == True)
+    ).count()
     
-    if not member:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Member not found"
+    now = datetime.utcnow()
+    
+    # New members this month
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    new_members_this_month = db.query(User).filter(
+        and_(
+            User.role == UserRoleEnum.MEMBER,
+            User.membership_date >= start_of_month
         )
+    ).count()
     
-    # Users can only see their own details, staff can see all
-    if (current_user.role == UserRoleEnum.MEMBER and 
-        current_user.id != member_id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
+    # Members with active loans
+    members_with_loans = db.query(func.count(func.distinct(Loan.user_id))).filter(
+        Loan.status == LoanStatusEnum.ACTIVE
+    ).scalar()
+    
+    # Members with overdue items
+    members_with_overdue = db.query(func.count(func.distinct(Loan.user_id))).filter(
+        and_(
+            Loan.status == LoanStatusEnum.ACTIVE,
+            Loan.due_date < now
         )
+    ).scalar()
     
+    return {
+        "total_members": total_members,
+        "active_members": active_members,
+        "inactive_members": total_members - active_members,
+        "new_members_this_month": new_members_this_month,
+        "members_with_active_loans": members_with_loans,
+        "members_with_overdue_items": members_with_overdue,
+        "top_borrowers_last_30_days": _top_borrowers(db)
+    }
+
+@router.get("/members/stats")
+def get_membership_statistics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_staff)
+):
+    """Get overall membership statistics - Staff only"""
+    return cached_json_response(_stats_cache, lambda: orjson.dumps(_compute_membership_statistics(db)))
+
+@router.get("/members/{member_id}", response_model=UserResponse)
+def get_member_details(member: User = Depends(_visible_member)):
+    """Get member details"""
     return member
 
 @router.put("/members/{member_id}", response_model=UserResponse)
 def update_member(
-    member_id: int,
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    member: User = Depends(_visible_member),
+    db: Session = Depends(get_db)
 ):
     """Update member information"""
     
-    member = db.query(User).filter(User.id == member_id).first()
-    
-    if not member:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Member not found"
-        )
-    
-    # Users can only update their own details, staff can update any
-    if (current_user.role == UserRoleEnum.MEMBER and 
-        current_user.id != member_id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    
     # Update fields if provided
     update_data = user_update.dict(exclude_unset=True)
     
@@ -165,9 +226,31 @@ def get_member_activity(
 ):
     """Get member's library activity statistics"""
     
-    member = db.query(User).filter(User.id == member_id).first()
-    
-    if not member:
+    # The member and every activity figure in one round trip, each figure
+    # a scalar subquery over the member's own rows
+    member_loans = select(func.count(Loan.id)).where(Loan.user_id == member_id)
+    active = and_(Loan.user_id == member_id, Loan.status == LoanStatusEnum.ACTIVE)
+    member_fines = select(func.coalesce(func.sum(Fine.amount), 0.0))
+    
+    row = db.query(
+        User,
+        member_loans.scalar_subquery().label("total_loans"),
+        member_loans.where(active).scalar_subquery().label("active_loans"),
+        member_loans.where(
+            and_(active, Loan.due_date < datetime.utcnow())
+        ).scalar_subquery().label("overdue_loans"),
+        select(func.count(Hold.id)).where(
+            and_(Hold.user_id == member_id, Hold.status == HoldStatusEnum.ACTIVE)
+        ).scalar_subquery().label("active_holds"),
+        member_fines.where(
+            and_(Fine.user_id == member_id, Fine.is_outstanding)
+        ).scalar_subquery().label("outstanding_fines"),
+        member_fines.where(
+            and_(Fine.user_id == member_id, Fine.is_paid)
+        ).scalar_subquery().label("total_fines_paid")
+    ).filter(User.id == member_id).first()
+    
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Member not found"
@@ -181,58 +264,35 @@ def get_member_activity(
             detail="Access denied"
         )
     
-    # Calculate statistics
-    total_loans = db.query(Loan).filter(Loan.user_id == member_id).count()
-    active_loans = db.query(Loan).filter(
-        and_(Loan.user_id == member_id, Loan.status == LoanStatusEnum.ACTIVE)
-    ).count()
-    
-    # Overdue loans
-    overdue_loans = db.query(Loan).filter(
-        and_(
-            Loan.user_id == member_id,
-            Loan.status == LoanStatusEnum.ACTIVE,
-            Loan.due_date < datetime.utcnow()
-        )
-    ).count()
-    
-    # Active holds
-    active_holds = db.query(Hold).filter(
-        and_(Hold.user_id == member_id, Hold.status == HoldStatusEnum.ACTIVE)
-    ).count()
-    
-    # Outstanding fines
-    outstanding_fines = db.query(func.sum(Fine.amount)).filter(
-        and_(Fine.user_id == member_id, Fine.is_paid == False)
-    ).scalar() or 0.0
+    member = row.User
     
-    # Total fines paid
-    total_fines_paid = db.query(func.sum(Fine.amount)).filter(
-        and_(Fine.user_id == member_id, Fine.is_paid == True)
-    ).scalar() or 0.0
-    
-    # Recent activity (last 5 loans)
+    # Recent activity (last 5 loans). The member is already in this session,
+    # so each row's user comes from the identity map without a query
     recent_loans = db.query(Loan).options(
-        joinedload(Loan.book_copy).joinedload(BookCopy.book)
+        selectinload(Loan.book_copy),
+        lazyload(Loan.user),
+        raiseload('*')
     ).filter(Loan.user_id == member_id).order_by(
-        Loan.loan_date.desc()
+        Loan.loan_date.desc(), Loan.id.desc()
     ).limit(5).all()
     
     # Current holds
     current_holds = db.query(Hold).options(
-        joinedload(Hold.book)
+        joinedload(Hold.book),
+        lazyload(Hold.user),
+        raiseload('*')
     ).filter(
         and_(Hold.user_id == member_id, Hold.status == HoldStatusEnum.ACTIVE)
     ).order_by(Hold.queue_position).all()
     
     return MembershipStats(
         member_since=member.membership_date,
-        total_loans=total_loans,
-        active_loans=active_loans,
-        overdue_loans=overdue_loans,
-        active_holds=active_holds,
-        outstanding_fines=outstanding_fines,
-        total_fines_paid=total_fines_paid,
+        total_loans=row.total_loans,
+        active_loans=row.active_loans,
+        overdue_loans=row.overdue_loans,
+        active_holds=row.active_holds,
+        outstanding_fines=row.outstanding_fines,
+        total_fines_paid=row.total_fines_paid,
         recent_loans=recent_loans,
         current_holds=current_holds,
         is_active=member.is_active
@@ -243,7 +303,7 @@ def deactivate_member(
     member_id: int,
     reason: str = Query(..., description="Reason for deactivation"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Deactivate a member account - Staff only"""
     
@@ -274,7 +334,7 @@ def deactivate_member(
     
     # Check for outstanding fines
     outstanding_fines = db.query(func.sum(Fine.amount)).filter(
-        and_(Fine.user_id == member_id, Fine.is_paid == False)
+        and_(Fine.user_id == member_id, Fine.is_outstanding)
     ).scalar() or 0.0
     
     if outstanding_fines > 0:
@@ -286,14 +346,13 @@ def deactivate_member(
     # Deactivate the member
     member.is_active = False
     
-    # Cancel any active holds
-    active_holds = db.query(Hold).filter(
+    # Cancel any active holds in a single UPDATE
+    cancelled_holds = db.query(Hold).filter(
         and_(Hold.user_id == member_id, Hold.status == HoldStatusEnum.ACTIVE)
-    ).all()
-    
-    for hold in active_holds:
-        hold.status = HoldStatusEnum.CANCELLED
-        hold.notes = f"{hold.notes or ''}\nCancelled due to account deactivation: {reason}".strip()
+    ).update({
+        Hold.status: HoldStatusEnum.CANCELLED,
+        Hold.notes: append_note(Hold.notes, f"Cancelled due to account deactivation: {reason}")
+    }, synchronize_session=False)
     
     db.commit()
     
@@ -301,7 +360,7 @@ def deactivate_member(
         "message": "Member deactivated successfully",
         "member_email": member.email,
         "reason": reason,
-        "cancelled_holds": len(active_holds),
+        "cancelled_holds": cancelled_holds,
         "deactivated_at": datetime.utcnow()
     }
 
@@ -310,7 +369,7 @@ def reactivate_member(
     member_id: int,
     notes: str = Query(None, description="Notes for reactivation"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Reactivate a member account - Staff only"""
     
@@ -339,66 +398,3 @@ def reactivate_member(
         "notes": notes,
         "reactivated_at": datetime.utcnow()
     }
-
-@router.get("/members/stats")
-def get_membership_statistics(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
-):
-    """Get overall membership statistics - Staff only"""
-    
-    total_members = db.query(User).filter(User.role == UserRoleEnum.MEMBER).count()
-    active_members = db.query(User).filter(
-        and_(User.role == UserRoleEnum.MEMBER, User.is_active == True)
-    ).count()
-    
-    # New members this month
-    start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    new_members_this_month = db.query(User).filter(
-        and_(
-            User.role == UserRoleEnum.MEMBER,
-            User.membership_date >= start_of_month
-        )
-    ).count()
-    
-    # Members with active loans
-    members_with_loans = db.query(func.count(func.distinct(Loan.user_id))).filter(
-        Loan.status == LoanStatusEnum.ACTIVE
-    ).scalar()
-    
-    # Members with overdue items
-    members_with_overdue = db.query(func.count(func.distinct(Loan.user_id))).filter(
-        and_(
-            Loan.status == LoanStatusEnum.ACTIVE,
-            Loan.due_date < datetime.utcnow()
-        )
-    ).scalar()
-    
-    # Top borrowers (most loans in last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    top_borrowers = db.query(
-        User.full_name,
-        User.email,
-        func.count(Loan.id).label('loan_count')
-    ).join(Loan).filter(
-        Loan.loan_date >= thirty_days_ago
-    ).group_by(User.id, User.full_name, User.email).order_by(
-        func.count(Loan.id).desc()
-    ).limit(5).all()
-    
-    return {
-        "total_members": total_members,
-        "active_members": active_members,
-        "inactive_members": total_members - active_members,
-        "new_members_this_month": new_members_this_month,
-        "members_with_active_loans": members_with_loans,
-        "members_with_overdue_items": members_with_overdue,
-        "top_borrowers_last_30_days": [
-            {
-                "name": borrower.full_name,
-                "email": borrower.email,
-                "loan_count": borrower.loan_count
-            }
-            for borrower in top_borrowers
-        ]
-    }
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, case
 from typing import List, Optional
 from datetime import datetime, timedelta
-from models import NotificationResponse, UserRole
-from auth import get_current_user, require_role
+from models import NotificationResponse, TokenData
+from auth import get_current_principal, require_staff
 from database import (
     get_db, User, Notification,
     NotificationTypeEnum, UserRoleEnum
@@ -12,35 +12,65 @@ from database import (
 
 router = APIRouter()
 
+# Enum members keyed by their string values, for request validation
+_NOTIF_TYPES = {t.value: t for t in NotificationTypeEnum}
+_USER_ROLES = {r.value: r for r in UserRoleEnum}
+
 @router.get("/notifications/", response_model=List[NotificationResponse])
 def get_user_notifications(
+    response: Response,
     unread_only: bool = Query(False, description="Show only unread notifications"),
     limit: int = Query(20, ge=1, le=50),
+    before_id: Optional[int] = Query(None, description="Return notifications older than this id (from X-Next-Cursor)"),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    principal: TokenData = Depends(get_current_principal)
 ):
     """Get current user's notifications"""
     
-    query = db.query(Notification).filter(Notification.user_id == current_user.id)
+    query = db.query(Notification).filter(Notification.user_id == principal.user_id)
     
     if unread_only:
         query = query.filter(Notification.is_read == False)
     
-    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
+    if before_id is not None:
+        query = query.filter(Notification.id < before_id)
+    
+    # Clients poll this endpoint, so answer unchanged polls with a 304 from
+    # one aggregate query instead of loading and serializing the rows
+    count, max_id, unread, last_read_at = query.with_entities(
+        func.count(Notification.id),
+        func.max(Notification.id),
+        func.coalesce(func.sum(case((Notification.is_read == False, 1), else_=0)), 0),
+        func.max(Notification.read_at)
+    ).one()
+    last_read = last_read_at.timestamp() if last_read_at else 0
+    etag = f'W/"{count}-{max_id or 0}-{unread}-{last_read}"'
+    
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    
+    # Keyset pagination: ids grow with creation time, so newest-first by id
+    # is an index range scan no matter how deep the client pages
+    notifications = query.order_by(Notification.id.desc()).limit(limit).all()
+    if len(notifications) == limit:
+        response.headers["X-Next-Cursor"] = str(notifications[-1].id)
     return notifications
 
 @router.put("/notifications/{notification_id}/read")
 def mark_notification_read(
     notification_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    principal: TokenData = Depends(get_current_principal)
 ):
     """Mark a notification as read"""
     
     notification = db.query(Notification).filter(
         and_(
             Notification.id == notification_id,
-            Notification.user_id == current_user.id
+            Notification.user_id == principal.user_id
         )
     ).first()
     
@@ -60,22 +90,19 @@ def mark_notification_read(
 @router.put("/notifications/mark-all-read")
 def mark_all_notifications_read(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    principal: TokenData = Depends(get_current_principal)
 ):
     """Mark all notifications as read for the current user"""
     
-    unread_notifications = db.query(Notification).filter(
+    count = db.query(Notification).filter(
         and_(
-            Notification.user_id == current_user.id,
+            Notification.user_id == principal.user_id,
             Notification.is_read == False
         )
-    ).all()
-    
-    count = len(unread_notifications)
-    
-    for notification in unread_notifications:
-        notification.is_read = True
-        notification.read_at = datetime.utcnow()
+    ).update(
+        {"is_read": True, "read_at": datetime.utcnow()},
+        synchronize_session=False
+    )
     
     db.commit()
     
@@ -87,35 +114,23 @@ def mark_all_notifications_read(
 @router.get("/notifications/summary")
 def get_notification_summary(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    principal: TokenData = Depends(get_current_principal)
 ):
     """Get notification summary for the current user"""
     
-    total_notifications = db.query(Notification).filter(
-        Notification.user_id == current_user.id
-    ).count()
-    
-    unread_notifications = db.query(Notification).filter(
-        and_(
-            Notification.user_id == current_user.id,
-            Notification.is_read == False
-        )
-    ).count()
-    
-    # Get recent notifications (last 7 days)
+    # Total, unread and recent (last 7 days) counts in one pass
     week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_notifications = db.query(Notification).filter(
-        and_(
-            Notification.user_id == current_user.id,
-            Notification.created_at >= week_ago
-        )
-    ).count()
+    counts = db.query(
+        func.count(Notification.id).label("total"),
+        func.coalesce(func.sum(case((Notification.is_read == False, 1), else_=0)), 0).label("unread"),
+        func.coalesce(func.sum(case((Notification.created_at >= week_ago, 1), else_=0)), 0).label("recent")
+    ).filter(Notification.user_id == principal.user_id).one()
     
     return {
-        "total_notifications": total_notifications,
-        "unread_notifications": unread_notifications,
-        "recent_notifications": recent_notifications,
-        "has_unread": unread_notifications > 0
+        "total_notifications": counts.total,
+        "unread_notifications": counts.unread,
+        "recent_notifications": counts.recent,
+        "has_unread": counts.unread > 0
     }
 
 # Staff-only endpoints
@@ -126,45 +141,43 @@ def broadcast_notification(
     notification_type: str = "general",
     target_role: Optional[str] = Query(None, description="Target specific role (admin, librarian, member)"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_role([UserRole.ADMIN, UserRole.LIBRARIAN]))
+    current_user: User = Depends(require_staff)
 ):
     """Broadcast notification to users - Staff only"""
     
     # Validate notification type
-    try:
-        notif_type = NotificationTypeEnum(notification_type)
-    except ValueError:
+    notif_type = _NOTIF_TYPES.get(notification_type)
+    if notif_type is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid notification type. Valid options: {[t.value for t in NotificationTypeEnum]}"
+            detail=f"Invalid notification type. Valid options: {list(_NOTIF_TYPES)}"
         )
     
     # Get target users
     query = db.query(User).filter(User.is_active == True)
     
     if target_role:
-        try:
-            role_enum = UserRoleEnum(target_role)
-            query = query.filter(User.role == role_enum)
-        except ValueError:
+        role_enum = _USER_ROLES.get(target_role)
+        if role_enum is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid role. Valid options: {[r.value for r in UserRoleEnum]}"
+                detail=f"Invalid role. Valid options: {list(_USER_ROLES)}"
             )
-    
-    target_users = query.all()
-    
-    # Create notifications for each user
-    notifications_created = 0
-    for user in target_users:
-        notification = Notification(
-            user_id=user.id,
-            title=title,
-            message=message,
-            notification_type=notif_type
-        )
-        db.add(notification)
-        notifications_created += 1
+        query = query.filter(User.role == role_enum)
+    
+    target_user_ids = query.with_entities(User.id).all()
+    
+    # Create notifications for each user in a single bulk INSERT
+    db.bulk_insert_mappings(Notification, [
+        {
+            "user_id": user_id,
+            "title": title,
+            "message": message,
+            "notification_type": notif_type
+        }
+        for (user_id,) in target_user_ids
+    ])
+    notifications_created = len(target_user_ids)
     
     db.commit()
     
@@ -1,225 +1,131 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from database import SessionLocal, User, Book, BookCopy, UserRoleEnum, BookCopyStatusEnum
 from auth import hash_password
+from crud import generate_barcodes
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import csv
+import io
+import sys
+import traceback
 import uuid
 
+# Enum members used throughout the seed rows
+_ADMIN = UserRoleEnum.ADMIN
+_LIBRARIAN = UserRoleEnum.LIBRARIAN
+_MEMBER = UserRoleEnum.MEMBER
+_AVAILABLE = BookCopyStatusEnum.AVAILABLE
+
+# Sample users (library members and staff); the password comes last so
+# zipping with _USER_FIELDS leaves it out of the column values
+_USER_FIELDS = ("email", "full_name", "role", "phone", "address")
+_USERS = (
+    ("admin@library.com", "Library Administrator", _ADMIN,
+     "+1-555-0001", "123 Library Admin St, Book City, BC 12345", "password123"),
+    ("librarian@library.com", "Jane Librarian", _LIBRARIAN,
+     "+1-555-0002", "456 Librarian Ave, Book City, BC 12345", "password123"),
+    ("member@library.com", "John Member", _MEMBER,
+     "+1-555-0003", "789 Member Dr, Book City, BC 12345", "password123"),
+    ("alice.reader@email.com", "Alice Reader", _MEMBER,
+     "+1-555-0004", "321 Reading St, Book City, BC 12345", "alice123"),
+    ("bob.bookworm@email.com", "Bob Bookworm", _MEMBER,
+     "+1-555-0005", "654 Literature Ln, Book City, BC 12345", "bob123"),
+)
+
+# Sample books with library-appropriate metadata
+_BOOK_FIELDS = ("title", "author", "isbn", "publisher", "publication_year", "genre", "description", "total_copies")
+_BOOKS = (
+    ("The Great Gatsby", "F. Scott Fitzgerald", "978-0-7432-7356-5", "Scribner", 1925,
+     "Fiction", "A classic American novel set in the Jazz Age.", 3),
+    ("To Kill a Mockingbird", "Harper Lee", "978-0-06-112008-4", "J.B. Lippincott & Co.", 1960,
+     "Fiction", "A novel about racial injustice in the American South.", 2),
+    ("1984", "George Orwell", "978-0-452-28423-4", "Secker & Warburg", 1949,
+     "Dystopian Fiction", "A dystopian social science fiction novel.", 4),
+    ("Pride and Prejudice", "Jane Austen", "978-0-14-143951-8", "T. Egerton", 1813,
+     "Romance", "A romantic novel of manners.", 2),
+    ("The Catcher in the Rye", "J.D. Salinger", "978-0-316-76948-0", "Little, Brown and Company", 1951,
+     "Fiction", "A controversial coming-of-age story.", 2),
+    ("Lord of the Flies", "William Golding", "978-0-571-05686-2", "Faber & Faber", 1954,
+     "Allegorical Fiction", "A story about British boys stranded on an island.", 3),
+    ("Jane Eyre", "Charlotte Brontë", "978-0-14-144114-6", "Smith, Elder & Co.", 1847,
+     "Gothic Fiction", "A bildungsroman following the experiences of its title character.", 2),
+    ("The Hobbit", "J.R.R. Tolkien", "978-0-547-92822-7", "George Allen & Unwin", 1937,
+     "Fantasy", "A children's fantasy novel about Bilbo Baggins.", 4),
+    ("Fahrenheit 451", "Ray Bradbury", "978-1-451-67331-9", "Ballantine Books", 1953,
+     "Dystopian Fiction", "A dystopian novel about a future where books are banned.", 2),
+    ("Brave New World", "Aldous Huxley", "978-0-06-085052-4", "Chatto & Windus", 1932,
+     "Science Fiction", "A dystopian novel set in a futuristic World State.", 3),
+)
+
 def create_seed_data():
     """Create initial seed data for the library system"""
-    db = SessionLocal()
-    
-    try:
-        # Check if data already exists
-        if db.query(User).first() or db.query(Book).first():
+    # The transaction commits when the block exits and rolls back if
+    # anything in it raises; callers decide how to report the error
+    with SessionLocal() as db, db.begin():
+        # Check if data already exists, both tables in one round-trip
+        if db.query(or_(db.query(User.id).exists(), db.query(Book.id).exists())).scalar():
             print("Seed data already exists, skipping...")
             return
         
-        # Create sample users (library members and staff)
-        users_data = [
-            {
-                "email": "admin@library.com",
-                "full_name": "Library Administrator",
-                "role": UserRoleEnum.ADMIN,
-                "password": "password123",
-                "phone": "+1-555-0001",
-                "address": "123 Library Admin St, Book City, BC 12345"
-            },
-            {
-                "email": "librarian@library.com",
-                "full_name": "Jane Librarian",
-                "role": UserRoleEnum.LIBRARIAN,
-                "password": "password123",
-                "phone": "+1-555-0002",
-                "address": "456 Librarian Ave, Book City, BC 12345"
-            },
-            {
-                "email": "member@library.com",
-                "full_name": "John Member",
-                "role": UserRoleEnum.MEMBER,
-                "password": "password123",
-                "phone": "+1-555-0003",
-                "address": "789 Member Dr, Book City, BC 12345"
-            },
-            {
-                "email": "alice.reader@email.com",
-                "full_name": "Alice Reader",
-                "role": UserRoleEnum.MEMBER,
-                "password": "alice123",
-                "phone": "+1-555-0004",
-                "address": "321 Reading St, Book City, BC 12345"
-            },
-            {
-                "email": "bob.bookworm@email.com", 
-                "full_name": "Bob Bookworm",
-                "role": UserRoleEnum.MEMBER,
-                "password": "bob123",
-                "phone": "+1-555-0005",
-                "address": "654 Literature Ln, Book City, BC 12345"
-            }
-        ]
+        # Hashing dominates the seed; the hasher releases the GIL, so the
+        # passwords hash in parallel
+        with ThreadPoolExecutor(max_workers=len(_USERS)) as executor:
+            hashes = list(executor.map(hash_password, [user[-1] for user in _USERS]))
         
-        for user_data in users_data:
-            db_user = User(
-                email=user_data["email"],
-                full_name=user_data["full_name"],
-                role=user_data["role"],
-                hashed_password=hash_password(user_data["password"]),
-                phone=user_data["phone"],
-                address=user_data["address"]
-            )
-            db.add(db_user)
+        db.bulk_insert_mappings(User, [
+            {**dict(zip(_USER_FIELDS, user)), "hashed_password": hashed_password}
+            for user, hashed_password in zip(_USERS, hashes)
+        ])
         
-        # Create sample books with library-appropriate metadata
-        books_data = [
-            {
-                "title": "The Great Gatsby",
-                "author": "F. Scott Fitzgerald",
-                "isbn": "978-0-7432-7356-5",
-                "publisher": "Scribner",
-                "publication_year": 1925,
-                "genre": "Fiction",
-                "description": "A classic American novel set in the Jazz Age.",
-                "total_copies": 3
-            },
-            {
-                "title": "To Kill a Mockingbird",
-                "author": "Harper Lee",
-                "isbn": "978-0-06-112008-4",
-                "publisher": "J.B. Lippincott & Co.",
-                "publication_year": 1960,
-                "genre": "Fiction",
-                "description": "A novel about racial injustice in the American South.",
-                "total_copies": 2
-            },
-            {
-                "title": "1984",
-                "author": "George Orwell",
-                "isbn": "978-0-452-28423-4",
-                "publisher": "Secker & Warburg",
-                "publication_year": 1949,
-                "genre": "Dystopian Fiction",
-                "description": "A dystopian social science fiction novel.",
-                "total_copies": 4
-            },
-            {
-                "title": "Pride and Prejudice",
-                "author": "Jane Austen",
-                "isbn": "978-0-14-143951-8",
-                "publisher": "T. Egerton",
-                "publication_year": 1813,
-                "genre": "Romance",
-                "description": "A romantic novel of manners.",
-                "total_copies": 2
-            },
-            {
-                "title": "The Catcher in the Rye",
-                "author": "J.D. Salinger",
-                "isbn": "978-0-316-76948-0",
-                "publisher": "Little, Brown and Company",
-                "publication_year": 1951,
-                "genre": "Fiction",
-                "description": "A controversial coming-of-age story.",
-                "total_copies": 2
-            },
-            {
-                "title": "Lord of the Flies",
-                "author": "William Golding",
-                "isbn": "978-0-571-05686-2",
-                "publisher": "Faber & Faber",
-                "publication_year": 1954,
-                "genre": "Allegorical Fiction",
-                "description": "A story about British boys stranded on an island.",
-                "total_copies": 3
-            },
-            {
-                "title": "Jane Eyre",
-                "author": "Charlotte Brontë",
-                "isbn": "978-0-14-144114-6",
-                "publisher": "Smith, Elder & Co.",
-                "publication_year": 1847,
-                "genre": "Gothic Fiction",
-                "description": "A bildungsroman following the experiences of its title character.",
-                "total_copies": 2
-            },
-            {
-                "title": "The Hobbit",
-                "author": "J.R.R. Tolkien",
-                "isbn": "978-0-547-92822-7",
-                "publisher": "George Allen & Unwin",
-                "publication_year": 1937,
-                "genre": "Fantasy",
-                "description": "A children's fantasy novel about Bilbo Baggins.",
-                "total_copies": 4
-            },
-            {
-                "title": "Fahrenheit 451",
-                "author": "Ray Bradbury",
-                "isbn": "978-1-451-67331-9",
-                "publisher": "Ballantine Books",
-                "publication_year": 1953,
-                "genre": "Dystopian Fiction",
-                "description": "A dystopian novel about a future where books are banned.",
-                "total_copies": 2
-            },
+        # Create books and their copies, one bulk INSERT per table
+        db.bulk_insert_mappings(Book, [
+            {**dict(zip(_BOOK_FIELDS, book)), "available_copies": book[-1]}
+            for book in _BOOKS
+        ])
+        id_by_isbn = dict(db.query(Book.isbn, Book.id).all())
+        
+        copies = [
             {
-                "title": "Brave New World",
-                "author": "Aldous Huxley",
-                "isbn": "978-0-06-085052-4",
-                "publisher": "Chatto & Windus",
-                "publication_year": 1932,
-                "genre": "Science Fiction",
-                "description": "A dystopian novel set in a futuristic World State.",
-                "total_copies": 3
+                "book_id": id_by_isbn[isbn],
+                "barcode": barcode,
+                "status": _AVAILABLE,
+                "condition_notes": "Good condition"
             }
+            for _, _, isbn, *_, total_copies in _BOOKS
+            for barcode in generate_barcodes(isbn, id_by_isbn[isbn], 1, total_copies)
         ]
         
-        # Create books and their copies
-        for book_data in books_data:
-            total_copies = book_data.pop("total_copies")
-            
-            # Create the book record
-            db_book = Book(
-                **book_data,
-                total_copies=total_copies,
-                available_copies=total_copies
+        # On PostgreSQL the copies stream in through COPY, which skips
+        # per-row parameter binding; it pays off once the list runs to
+        # thousands. The enum column stores member names, as SQLAlchemy does
+        if db.get_bind().dialect.name == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                (copy["book_id"], copy["barcode"], copy["status"].name, copy["condition_notes"])
+                for copy in copies
             )
-            db.add(db_book)
-            db.flush()  # Get the book ID
-            
-            # Create individual copies of each book
-            for copy_num in range(1, total_copies + 1):
-                barcode = f"{db_book.isbn.replace('-', '')}{copy_num:03d}" if db_book.isbn else f"BOOK{db_book.id:04d}{copy_num:03d}"
-                
-                book_copy = BookCopy(
-                    book_id=db_book.id,
-                    barcode=barcode,
-                    status=BookCopyStatusEnum.AVAILABLE,
-                    condition_notes="Good condition"
+            buffer.seek(0)
+            with db.connection().connection.cursor() as cursor:
+                cursor.copy_expert(
+                    "COPY book_copies (book_id, barcode, status, condition_notes) FROM STDIN WITH (FORMAT csv)",
+                    buffer
                 )
-                db.add(book_copy)
-        
-        db.commit()
-        
-        # Count total copies created
-        total_book_copies = db.query(BookCopy).count()
-        
-        print("✅ Library seed data created successfully!")
-        print(f"📚 Created {len(books_data)} book titles with {total_book_copies} physical copies")
-        print("👥 Created 5 users:")
-        print("   - admin@library.com (Admin)")
-        print("   - librarian@library.com (Librarian)")
-        print("   - member@library.com (Member)")
-        print("   - alice.reader@email.com (Member)")
-        print("   - bob.bookworm@email.com (Member)")
-        print("🏛️ Library is ready for operation!")
-        
+        else:
+            db.bulk_insert_mappings(BookCopy, copies)
+    
+    print("\n".join([
+        "✅ Library seed data created successfully!",
+        f"📚 Created {len(_BOOKS)} book titles with {len(copies)} physical copies",
+        f"👥 Created {len(_USERS)} users:",
+        *(f"   - {email} ({role.value.title()})" for email, _, role, *_ in _USERS),
+        "🏛️ Library is ready for operation!"
+    ]))
+
+if __name__ == "__main__":
+    try:
+        create_seed_data()
     except Exception as e:
         print(f"❌ Error creating seed data: {e}")
-        import traceback
         traceback.print_exc()
-        db.rollback()
-    finally:
-        db.close()
-
-if __name__ == "__main__":
-    create_seed_data()
+        sys.exit(1)
@@ -1,3 +1,4 @@
+from concurrent.futures import ProcessPoolExecutor
 from sqlalchemy.orm import Session
 from database import SessionLocal, User, Book, UserRoleEnum
 from auth import hash_password
@@ -34,14 +35,19 @@ def create_seed_data():
             }
         ]
         
-        for user_data in users_data:
-            db_user = User(
+        # Hashing is CPU-bound, so spread it across cores
+        with ProcessPoolExecutor() as executor:
+            hashes = list(executor.map(hash_password, [u["password"] for u in users_data]))
+        
+        users = [
+            User(
                 email=user_data["email"],
                 full_name=user_data["full_name"],
                 role=user_data["role"],
-                hashed_password=hash_password(user_data["password"])
+                hashed_password=hashed
             )
-            db.add(db_user)
+            for user_data, hashed in zip(users_data, hashes)
+        ]
         
         # Create sample books
         books_data = [
@@ -62,10 +68,10 @@ def create_seed_data():
             {"title": "The Hitchhiker's Guide to the Galaxy", "author": "Douglas Adams", "price": 14.99}
         ]
         
-        for book_data in books_data:
-            db_book = Book(**book_data)
-            db.add(db_book)
+        books = [Book(**book_data) for book_data in books_data]
         
+        db.bulk_save_objects(users)
+        db.bulk_save_objects(books)
         db.commit()
         print("✅ Seed data created successfully!")
         print("📚 Created 15 books")
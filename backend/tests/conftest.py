@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway SQLite database before it is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+from fastapi.testclient import TestClient
+from main import app
+
+@pytest.fixture(scope="session")
+def client():
+    """Client for the app, started up (tables created and seeded) once per run"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def login(client):
+    """Return Authorization headers for a seeded user"""
+    def _login(email: str, password: str = "password123") -> dict:
+        response = client.post("/auth/login", json={"email": email, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return _login
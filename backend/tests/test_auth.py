@@ -0,0 +1,49 @@
+import threading
+
+from passlib.hash import bcrypt
+
+import auth
+from database import SessionLocal, User, engine
+
+def test_login_checks_the_password_without_holding_a_connection(client, monkeypatch):
+    seen = {}
+    verify = auth.verify_and_update_password
+    
+    def watched_verify(plain_password, hashed_password):
+        seen["thread"] = threading.current_thread().name
+        seen["connections"] = engine.pool.checkedout()
+        return verify(plain_password, hashed_password)
+    
+    monkeypatch.setattr(auth, "verify_and_update_password", watched_verify)
+    response = client.post("/auth/login", json={"email": "librarian@library.com", "password": "password123"})
+    
+    assert response.status_code == 200, response.text
+    assert seen["thread"].startswith("pwd-hash")
+    assert seen["connections"] == 0
+
+def test_login_upgrades_legacy_bcrypt_hashes(client):
+    with SessionLocal() as db:
+        db.add(User(email="legacy@library.com", full_name="Legacy Member", hashed_password=bcrypt.using(rounds=4).hash("old-secret")))
+        db.commit()
+    
+    response = client.post("/auth/login", json={"email": "legacy@library.com", "password": "old-secret"})
+    assert response.status_code == 200, response.text
+    
+    with SessionLocal() as db:
+        stored = db.query(User.hashed_password).filter(User.email == "legacy@library.com").scalar()
+    assert stored.startswith("$argon2")
+
+def test_register_creates_an_account_that_can_log_in(client):
+    response = client.post("/auth/register", json={
+        "email": "new.reader@email.com", "full_name": "New Reader", "password": "reader-pass"
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == "new.reader@email.com"
+    
+    again = client.post("/auth/register", json={
+        "email": "new.reader@email.com", "full_name": "New Reader", "password": "reader-pass"
+    })
+    assert again.status_code == 400
+    
+    login = client.post("/auth/login", json={"email": "new.reader@email.com", "password": "reader-pass"})
+    assert login.status_code == 200, login.text
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from database import Book
+from routes.books import _book_search_filter
+
+# Partial words and ISBN fragments, and a search that must not match
+SEARCHES = [("Gats", True), ("great gats", True), ("Fitzger", True), ("7356", True), ("978-0-7432", True), ("Gatsbyx", False)]
+
+@pytest.mark.parametrize("search, found", SEARCHES)
+def test_catalog_search_matches_partial_words(client, login, search, found):
+    response = client.get("/books", params={"search": search}, headers=login("member@library.com"))
+    assert response.status_code == 200
+    assert ("The Great Gatsby" in [book["title"] for book in response.json()]) == found
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="set TEST_POSTGRES_URL to an empty PostgreSQL database")
+@pytest.mark.parametrize("search, found", SEARCHES)
+def test_postgresql_catalog_search_matches_partial_words(search, found):
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    with engine.connect() as conn:
+        Book.__table__.create(conn, checkfirst=True)
+        conn.execute(Book.__table__.insert().values(
+            title="The Great Gatsby", author="F. Scott Fitzgerald", isbn="978-0-7432-7356-5"
+        ))
+        matches = conn.execute(select(Book.title).where(_book_search_filter(search, "postgresql"))).scalars().all()
+        conn.rollback()
+    engine.dispose()
+    
+    assert ("The Great Gatsby" in matches) == found
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import SessionLocal, BookCopy, BookCopyStatusEnum, Fine, Loan
+
+def add_fine(amount: float) -> int:
+    """Insert a fine behind the app's back, as another worker would"""
+    with SessionLocal() as db:
+        fine = Fine(user_id=4, amount=amount, reason="damage")
+        db.add(fine)
+        db.commit()
+        return fine.id
+
+@pytest.mark.parametrize("path", ["/fines/stats", "/fines/report"])
+def test_new_fines_change_the_etag(client, login, path):
+    staff = login("admin@library.com")
+    
+    before = client.get(path, headers=staff)
+    assert before.status_code == 200
+    
+    add_fine(4.0)
+    
+    after = client.get(path, headers={**staff, "If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    
+    summary = (lambda body: body.get("summary", body))
+    assert summary(after.json())["total_fines"] == summary(before.json())["total_fines"] + 1
+
+def test_returning_an_overdue_loan_updates_fine_statistics(client, login):
+    staff = login("admin@library.com")
+    before = client.get("/fines/stats", headers=staff).json()
+    
+    # Check a copy out, then backdate it so returning it charges a fine
+    with SessionLocal() as db:
+        copy = db.query(BookCopy).filter(BookCopy.status == BookCopyStatusEnum.AVAILABLE).first()
+        copy.status = BookCopyStatusEnum.CHECKED_OUT
+        loan = Loan(user_id=4, book_copy_id=copy.id, due_date=datetime.utcnow() - timedelta(days=10))
+        db.add(loan)
+        db.commit()
+        loan_id = loan.id
+    
+    response = client.put(f"/loans/{loan_id}/return", json={}, headers=staff)
+    assert response.status_code == 200, response.text
+    
+    after = client.get("/fines/stats", headers=staff).json()
+    assert after["total_fines"] == before["total_fines"] + 1
+
+def test_waived_fines_are_not_counted_as_collected(client, login):
+    staff = login("admin@library.com")
+    before = client.get("/fines/stats", headers=staff).json()
+    
+    paid, waived = add_fine(2.5), add_fine(1.5)
+    assert client.post(f"/fines/{paid}/pay", json={"payment_method": "cash"}, headers=staff).status_code == 200
+    assert client.post(f"/fines/{waived}/waive", params={"reason": "goodwill"}, headers=staff).status_code == 200
+    
+    after = client.get("/fines/stats", headers=staff).json()
+    assert after["paid_fines"] == before["paid_fines"] + 1
+    assert after["collected_amount"] == round(before["collected_amount"] + 2.5, 2)
+    assert after["waived_amount"] == round(before["waived_amount"] + 1.5, 2)
+    assert after["outstanding_amount"] == before["outstanding_amount"]
+    
+    fine = client.get(f"/fines/{waived}", headers=staff).json()
+    assert (fine["status"], fine["is_paid"]) == ("waived", False)
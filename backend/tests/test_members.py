@@ -0,0 +1,29 @@
+from database import SessionLocal, Hold, HoldStatusEnum
+
+def test_deactivate_member_cancels_active_holds(client, login):
+    staff = login("librarian@library.com")
+    
+    # Bob (seeded member 5) is queued for a book
+    with SessionLocal() as db:
+        hold = Hold(user_id=5, book_id=2, status=HoldStatusEnum.ACTIVE, queue_position=1, notes="Front desk pickup")
+        db.add(hold)
+        db.commit()
+        hold_id = hold.id
+    
+    response = client.put("/members/5/deactivate", params={"reason": "Moved away"}, headers=staff)
+    assert response.status_code == 200, response.text
+    assert response.json()["cancelled_holds"] == 1
+    
+    response = client.get(f"/holds/{hold_id}", headers=staff)
+    assert response.status_code == 200, response.text
+    hold = response.json()
+    assert hold["status"] == "cancelled"
+    assert hold["notes"] == "Front desk pickup\nCancelled due to account deactivation: Moved away"
+    
+    response = client.put("/members/5/deactivate", params={"reason": "Again"}, headers=staff)
+    assert response.status_code == 409
+
+def test_members_cannot_deactivate_accounts(client, login):
+    member = login("member@library.com")
+    response = client.put("/members/4/deactivate", params={"reason": "Nope"}, headers=member)
+    assert response.status_code == 403
@@ -0,0 +1,57 @@
+import os
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+
+from database import Base
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic.ini")
+
+def migrate(conn, revision):
+    config = Config(ALEMBIC_INI)
+    config.attributes["connection"] = conn
+    command.upgrade(config, revision)
+
+def test_migrations_build_the_models_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/fresh.db")
+    with engine.begin() as conn:
+        migrate(conn, "head")
+        diff = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    engine.dispose()
+    assert diff == []
+
+def test_upgrading_an_initial_database_adds_timestamp_defaults(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/initial.db")
+    with engine.begin() as conn:
+        migrate(conn, "0001")
+        conn.execute(text(
+            "INSERT INTO users (id, email, full_name, hashed_password, role) "
+            "VALUES (1, 'old@library.com', 'Old Member', 'x', 'MEMBER')"
+        ))
+        conn.execute(text("INSERT INTO books (id, title, author) VALUES (1, 'Old Book', 'Someone')"))
+        conn.execute(text("INSERT INTO book_copies (id, book_id, status) VALUES (1, 1, 'AVAILABLE')"))
+        conn.execute(text(
+            "INSERT INTO fines (user_id, amount, reason, is_paid) "
+            "VALUES (1, 2.5, 'overdue', 1), (1, 1.0, 'overdue', 0)"
+        ))
+        
+        migrate(conn, "head")
+        
+        # Inserts that leave the timestamp out, as the models now do
+        conn.execute(text(
+            "INSERT INTO loans (user_id, book_copy_id, due_date, status) "
+            "VALUES (1, 1, '2030-01-01 00:00:00', 'ACTIVE')"
+        ))
+        loan_date = conn.execute(text("SELECT loan_date FROM loans")).scalar_one()
+        statuses = conn.execute(text("SELECT status FROM fines ORDER BY id")).scalars().all()
+        hold_columns = {column["name"] for column in inspect(conn).get_columns("holds")}
+        fine_columns = {column["name"] for column in inspect(conn).get_columns("fines")}
+    engine.dispose()
+    
+    assert loan_date is not None
+    assert statuses == ["PAID", "UNPAID"]
+    assert {"fulfilled_date", "notes"} <= hold_columns
+    assert "is_paid" not in fine_columns
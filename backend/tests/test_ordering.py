@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from database import SessionLocal, Fine, Hold, HoldStatusEnum
+
+# SQLite's CURRENT_TIMESTAMP only has whole seconds, so rows created
+# together share a timestamp and must still list newest first
+SAME_SECOND = datetime(2026, 1, 15, 9, 30)
+
+def test_holds_with_equal_dates_list_newest_first(client, login):
+    member = login("member@library.com")
+    
+    with SessionLocal() as db:
+        holds = [
+            Hold(user_id=3, book_id=book_id, status=HoldStatusEnum.ACTIVE, queue_position=1, hold_date=SAME_SECOND)
+            for book_id in (3, 4, 5)
+        ]
+        db.add_all(holds)
+        db.commit()
+        hold_ids = [hold.id for hold in holds]
+    
+    response = client.get("/holds", headers=member)
+    assert response.status_code == 200, response.text
+    listed = [hold["id"] for hold in response.json() if hold["id"] in hold_ids]
+    assert listed == sorted(hold_ids, reverse=True)
+
+def test_fines_with_equal_dates_list_newest_first(client, login):
+    member = login("member@library.com")
+    
+    with SessionLocal() as db:
+        fines = [
+            Fine(user_id=3, amount=amount, reason="damage", fine_date=SAME_SECOND)
+            for amount in (1.0, 2.0, 3.0)
+        ]
+        db.add_all(fines)
+        db.commit()
+        fine_ids = [fine.id for fine in fines]
+    
+    response = client.get("/fines", headers=member)
+    assert response.status_code == 200, response.text
+    listed = [fine["id"] for fine in response.json() if fine["id"] in fine_ids]
+    assert listed == sorted(fine_ids, reverse=True)
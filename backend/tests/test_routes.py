@@ -0,0 +1,36 @@
+import pytest
+
+# Literal paths that share a prefix with an /{id} route
+STAFF_PATHS = [
+    "/books/genres",
+    "/loans/all",
+    "/loans/stats",
+    "/holds/all",
+    "/holds/stats",
+    "/fines/summary",
+    "/fines/all",
+    "/fines/stats",
+    "/fines/report",
+    "/members/stats",
+]
+
+@pytest.mark.parametrize("path", STAFF_PATHS)
+def test_literal_routes_are_not_shadowed(client, login, path):
+    response = client.get(path, headers=login("admin@library.com"))
+    assert response.status_code == 200, response.text
+
+@pytest.mark.parametrize("path", ["/fines/stats", "/fines/report"])
+def test_unchanged_fine_results_revalidate_with_304(client, login, path):
+    staff = login("admin@library.com")
+    
+    first = client.get(path, headers=staff)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    
+    second = client.get(path, headers={**staff, "If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert second.content == b""
+    
+    stale = client.get(path, headers={**staff, "If-None-Match": '"not-the-current-etag"'})
+    assert stale.status_code == 200
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from database import SessionLocal, User, UserRoleEnum
+from routes import loans, members
+
+STATS_ENDPOINTS = [
+    ("/loans/stats", loans, "_compute_loan_statistics"),
+    ("/members/stats", members, "_compute_membership_statistics"),
+]
+
+def _fail(*args, **kwargs):
+    raise OperationalError("SELECT ...", {}, Exception("canceling statement due to statement timeout"))
+
+@pytest.mark.parametrize("path,module,compute", STATS_ENDPOINTS)
+def test_stale_statistics_served_when_computing_them_fails(client, login, monkeypatch, path, module, compute):
+    headers = login("admin@library.com")
+    
+    # Fill the cache with the database still up, then expire the fresh copy
+    fresh = client.get(path, headers=headers)
+    assert fresh.status_code == 200
+    assert "X-Cache-Status" not in fresh.headers
+    module._stats_cache.clear()
+    
+    monkeypatch.setattr(module, compute, _fail)
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["X-Cache-Status"] == "stale"
+    assert response.json() == fresh.json()
+
+@pytest.mark.parametrize("path,module,compute", STATS_ENDPOINTS)
+def test_members_cannot_read_stale_statistics(client, login, monkeypatch, path, module, compute):
+    headers = login("member@library.com")
+    
+    monkeypatch.setattr(module, compute, _fail)
+    assert client.get(path, headers=headers).status_code == 403
+
+@pytest.mark.parametrize("path,module,compute", STATS_ENDPOINTS)
+def test_demoted_staff_lose_access_to_statistics(client, login, path, module, compute):
+    headers = login("librarian@library.com")
+    assert client.get(path, headers=headers).status_code == 200
+    
+    # The token still says librarian; the role in the database decides
+    with SessionLocal() as db:
+        db.query(User).filter(User.email == "librarian@library.com").update({User.role: UserRoleEnum.MEMBER})
+        db.commit()
+    try:
+        assert client.get(path, headers=headers).status_code == 403
+    finally:
+        with SessionLocal() as db:
+            db.query(User).filter(User.email == "librarian@library.com").update({User.role: UserRoleEnum.LIBRARIAN})
+            db.commit()